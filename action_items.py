@@ -0,0 +1,51 @@
+"""action_items.py – 議事録 Markdown から決定事項（◆）とタスク（★担当者　期限）を抜き出す
+
+MINUTES_PROMPT のテンプレートどおり、
+　- ◆ 決定内容<br>
+　- タスク内容（★担当者名　期限）<br>
+の形の箇条書きを 1 行ずつ読み取り、直前の「### 議題…」見出しを topic として添える。
+"""
+import re
+from typing import Dict, List, Optional
+
+_TASK_MARK = re.compile(r"[（(]\s*★\s*([^）)]*?)\s*[）)]")
+_BULLET = re.compile(r"^[\s　]*(?:[-*・]|\d+\.)[\s　]*")
+_BR = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+
+def _clean(line: str) -> str:
+    return _BR.sub("", _BULLET.sub("", line)).strip(" 　")
+
+
+def extract_items(minutes_md: Optional[str]) -> List[Dict]:
+    """議事録から kind（"task" / "decision"）・text・assignee・due・topic の辞書を出現順に返す"""
+    items: List[Dict] = []
+    topic = ""
+    for raw in (minutes_md or "").splitlines():
+        stripped = raw.strip(" 　")
+        if stripped.startswith("#"):
+            topic = stripped.lstrip("#").strip()
+            continue
+        m = _TASK_MARK.search(raw)
+        if m:
+            # 「★担当者名　期限」は空白（全角含む）の最初の区切りで担当者と期限に分ける
+            assignee, _, due = m.group(1).replace("　", " ").strip().partition(" ")
+            text = _clean(raw[:m.start()] + raw[m.end():]).lstrip("◆").strip(" 　")
+            if text:
+                items.append(dict(kind="task", text=text, assignee=assignee, due=due.strip(), topic=topic))
+            continue
+        text = _clean(raw)
+        if text.startswith("◆"):
+            text = text.lstrip("◆").strip(" 　")
+            if text:
+                items.append(dict(kind="decision", text=text, assignee="", due="", topic=topic))
+    return items
+
+
+def format_open_tasks(tasks: List[Dict]) -> str:
+    """fetch_open_tasks の結果をアジェンダ生成プロンプト用の短い箇条書きにする"""
+    lines = []
+    for t in tasks:
+        owner = "　".join(v for v in (t["assignee"], t["due"]) if v)
+        lines.append(f"- {t['text']}（★{owner or '未定'}）［{t['created_at']:%Y-%m-%d} {t['topic'] or t['title']}］")
+    return "\n".join(lines)
@@ -1,23 +1,99 @@
 import streamlit as st
 from pathlib import Path
-import tempfile
 import datetime as dt
-import os
-import time
+import hashlib
 
-from core_openai import transcribe_audio, generate_minutes as generate_minutes_openai, generate_next_agenda as generate_next_agenda_openai
-from core_gemini import transcribe_audio as transcribe_audio_gemini, generate_minutes as generate_minutes_gemini, generate_next_agenda as generate_next_agenda_gemini
+from backends import available_backends, build_providers, chunk_length_for_backends, enabled_backends
 from db import MinutesDB
-from templates import MINUTES_PROMPT, AGENDA_PROMPT
-from audio_utils import convert_m4a_to_mp3, split_mp3_to_chunks
+from audio_utils import AUDIO_PROFILES, DEFAULT_PROFILE
+from pipeline import merge_for, split_for_providers, stream_pipelines
+from cache import get_transcript_cache
+from jobs import JobQueue
+import metrics
 
 st.set_page_config(page_title="議事録作成ツール", page_icon="📝", layout="wide")
-st.title("📝 議事録作成ツール（OpenAI vs Gemini #ランダム性=0）")
+st.title(f"📝 議事録作成ツール（{' vs '.join(enabled_backends())} #ランダム性=0）")
 
-# DB 初期化
-data_dir = Path(__file__).parent / "data"
-data_dir.mkdir(exist_ok=True)
-db = MinutesDB(data_dir / "minutes.sqlite3")
+# DB 初期化（接続はリラン・セッションをまたいで 1 つを共有する）
+@st.cache_resource
+def get_db() -> MinutesDB:
+    data_dir = Path(__file__).parent / "data"
+    data_dir.mkdir(exist_ok=True)
+    return MinutesDB(data_dir / "minutes.sqlite3")
+
+
+db = get_db()
+
+
+# バックグラウンドジョブ（ワーカーはプロセスに 1 組だけ起動する）
+JOB_WORKERS = 2
+JOB_POLL_SEC = 5
+JOB_STATUS_LABELS = {"uploading": "📤 保存中", "queued": "⏳ 待機中", "running": "⚙️ 実行中",
+                     "done": "✅ 完了", "failed": "❌ 失敗"}
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    return JobQueue(
+        get_db(),
+        lambda params: build_providers(params.get("backends"), get_db(), use_cache=params.get("use_cache", True)),
+        workers=JOB_WORKERS,
+    )
+
+
+job_queue = get_job_queue()
+# 実行中のジョブがあれば、ジョブ欄だけを JOB_POLL_SEC ごとに描き直す（スクリプト本体は待たせない）。
+# この画面で処理を実行している間は、結果の描画を邪魔しないよう止める
+jobs_auto_refresh = st.session_state.get("jobs_auto_refresh", True)
+jobs_poll = (JOB_POLL_SEC if jobs_auto_refresh and job_queue.has_active_jobs()
+             and not st.session_state.get("start_interactive") else None)
+
+
+@st.experimental_fragment(run_every=jobs_poll)
+def render_jobs():
+    active = job_queue.has_active_jobs()
+    if jobs_poll and not active:
+        # ジョブが終わったら、保存された議事録を一覧に出すためにページ全体を更新する
+        st.rerun()
+    jobs = job_queue.list_jobs(limit=10)
+    if not jobs:
+        return
+    with st.expander("🗂️ バックグラウンドジョブ", expanded=active):
+        for job in jobs:
+            st.markdown(f"**#{job['id']} {job['title']}** — {JOB_STATUS_LABELS.get(job['status'], job['status'])}")
+            if job["status"] in ("queued", "running"):
+                if job["total_chunks"]:
+                    total = job["total_chunks"] * len(job["params"].get("backends") or enabled_backends())
+                    st.progress(min(job["chunks_done"] / total, 1.0),
+                                text=f"文字起こし {job['chunks_done']} / {total} チャンク")
+                else:
+                    st.caption(f"文字起こし済み {job['chunks_done']} チャンク（分割中）")
+            elif job["status"] == "failed":
+                lines = (job["error"] or "").strip().splitlines()
+                st.error(lines[-1] if lines else "失敗しました")
+                if job["retryable"] and st.button("再実行", key=f"job_retry_{job['id']}"):
+                    job_queue.retry(job["id"])
+                    st.rerun()
+            if job["status"] in ("done", "failed") and st.toggle("結果を表示", key=f"job_open_{job['id']}"):
+                results = job_queue.fetch_results(job["id"])
+                if results:
+                    for tab, res in zip(st.tabs([r["provider"] for r in results]), results):
+                        with tab:
+                            if res["error"]:
+                                st.error(res["error"])
+                                continue
+                            st.text_area("文字起こし結果", res["transcript"], height=200,
+                                         key=f"job_transcript_{job['id']}_{res['provider']}")
+                            st.subheader("議事録")
+                            st.markdown(res["minutes_md"], unsafe_allow_html=True)
+                            st.subheader("次回アジェンダ")
+                            st.markdown(res["agenda_md"], unsafe_allow_html=True)
+        auto = st.checkbox(f"実行中のジョブを自動更新（{JOB_POLL_SEC} 秒ごと）", value=True, key="jobs_auto_refresh")
+        if auto != jobs_auto_refresh:
+            st.rerun()  # 自動更新の切り替えはページ全体の再実行で反映する
+
+
+render_jobs()
 
 # ファイルアップロード
 uploaded_audio = st.file_uploader("🎤 会議音声（mp3/m4a 等）をアップロード", type=["mp3", "m4a"])
@@ -25,75 +101,163 @@ if not uploaded_audio:
     st.info("まず音声ファイルをアップロードしてください。")
     st.stop()
 
-# 変換（一度だけ）
-if not st.session_state.get('audio_converted'):
-    with st.spinner("ファイル読み込み＆変換中…"):
-        audio_bytes = uploaded_audio.read()
-        ext = Path(uploaded_audio.name).suffix.lower()
-        if ext == ".m4a":
-            mp3_bytes, _ = convert_m4a_to_mp3(input_bytes=audio_bytes, original_filename=uploaded_audio.name)
-            suffix = ".mp3"
-        else:
-            mp3_bytes = audio_bytes
-            suffix = ext
-        tf = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        tf.write(mp3_bytes)
-        tf.close()
-        st.session_state['audio_path'] = Path(tf.name)
-        st.session_state['audio_converted'] = True
-
-audio_path = st.session_state['audio_path']
-st.audio(str(audio_path), format=f"audio/{audio_path.suffix.replace('.', '')}")
+st.audio(uploaded_audio, format=f"audio/{Path(uploaded_audio.name).suffix.replace('.', '')}")
 
 # 実行ボタン
-if st.button("🚀 処理開始（OpenAI & Gemini）"):
-    with st.spinner("処理中です...しばらくお待ちください"):
-        # チャンク分割
-        chunk_paths = split_mp3_to_chunks(audio_path)
-        # 文字起こし
-        transcripts_oa, transcripts_gm = [], []
-        for chunk in chunk_paths:
-            transcripts_oa.append(transcribe_audio(chunk).strip())
-            transcripts_gm.append(transcribe_audio_gemini(chunk).strip())
-            os.remove(chunk)
-        os.remove(audio_path)
-        transcript_openai = "".join(transcripts_oa)
-        transcript_gemini = "".join(transcripts_gm)
-        # 議事録とアジェンダ生成
-        minutes_oa = generate_minutes_openai(transcript_openai, MINUTES_PROMPT)
-        agenda_oa = generate_next_agenda_openai(transcript_openai, AGENDA_PROMPT, db)
-        minutes_gm = generate_minutes_gemini(transcript_gemini, MINUTES_PROMPT)
-        agenda_gm = generate_next_agenda_gemini(transcript_gemini, AGENDA_PROMPT, db)
-
-    # 結果表示
-    tabs = st.tabs(["OpenAI", "Gemini"])
-    with tabs[0]:
-        st.header("OpenAI 結果")
-        st.subheader("文字起こし結果")
-        st.text_area("", transcript_openai, height=200)
-        st.subheader("議事録")
-        st.markdown(minutes_oa, unsafe_allow_html=True)
-        st.subheader("次回アジェンダ")
-        st.markdown(agenda_oa, unsafe_allow_html=True)
-        db.save_minutes(f"OpenAI {dt.datetime.now():%Y-%m-%d %H:%M}", transcript_openai, minutes_oa)
-    with tabs[1]:
-        st.header("Gemini 結果")
-        st.subheader("文字起こし結果")
-        st.text_area("", transcript_gemini, height=200)
-        st.subheader("議事録")
-        st.markdown(minutes_gm, unsafe_allow_html=True)
-        st.subheader("次回アジェンダ")
-        st.markdown(agenda_gm, unsafe_allow_html=True)
-        db.save_minutes(f"Gemini {dt.datetime.now():%Y-%m-%d %H:%M}", transcript_gemini, minutes_gm)
-
-# 過去の議事録
+profile = st.selectbox(
+    "音声プロファイル（asr_* はモノラル 16 kHz の音声認識向け設定）",
+    list(AUDIO_PROFILES),
+    index=list(AUDIO_PROFILES).index(DEFAULT_PROFILE),
+)
+split_mode = st.radio(
+    "分割方式",
+    ["固定長（変換しながら順次処理）", "無音位置で分割（並列数に合わせて均等化）"],
+    horizontal=True,
+)
+overlap_sec = 0.0
+if split_mode.startswith("無音"):
+    overlap_sec = st.number_input("チャンクの重なり（秒）", min_value=0.0, max_value=10.0, value=2.0, step=0.5)
+use_cache = not st.checkbox("生成キャッシュを使わずに再生成する", value=False)
+backend_names = st.multiselect("使用するプロバイダ（同時に実行）", available_backends(), default=enabled_backends())
+if not backend_names:
+    st.warning("プロバイダを 1 つ以上選んでください。")
+    st.stop()
+run_mode = st.radio(
+    "実行方法",
+    ["この画面で実行（結果を逐次表示）", "バックグラウンドジョブとして実行（リロードしても継続）"],
+    horizontal=True,
+)
+chunk_length_sec = chunk_length_for_backends(backend_names, profile)
+start = st.button(f"🚀 処理開始（{' & '.join(backend_names)}）", key="start_interactive")
+if "submitted_job_id" in st.session_state:
+    st.success(f"ジョブ #{st.session_state.pop('submitted_job_id')} を登録しました。"
+               "進捗は上の「バックグラウンドジョブ」で確認できます。")
+if start and run_mode.startswith("バックグラウンド"):
+    uploaded_audio.seek(0)
+    job_id = job_queue.submit(uploaded_audio, uploaded_audio.name, dict(
+        profile=profile,
+        split_mode="silence" if split_mode.startswith("無音") else "fixed",
+        overlap_sec=overlap_sec,
+        chunk_length_sec=chunk_length_sec,
+        use_cache=use_cache,
+        backends=backend_names,
+    ))
+    # ジョブ欄と自動更新はこの実行ではすでに描画済みなので、登録したジョブを出すためにページ全体を再実行する
+    st.session_state["submitted_job_id"] = job_id
+    st.rerun()
+elif start:
+    providers = build_providers(backend_names, db, use_cache=use_cache)
+    # 結果表示（各プロバイダのタブへ、届いた順に逐次描画）
+    *provider_tabs, metrics_tab = st.tabs([p.name for p in providers] + ["⏱️ 処理時間"])
+    tabs = dict(zip([p.name for p in providers], provider_tabs))
+    placeholders = {}
+    for name, tab in tabs.items():
+        with tab:
+            st.header(f"{name} 結果")
+            status = st.empty()
+            status.info(f"{name} で処理中です...")
+            st.subheader("文字起こし結果")
+            transcript_ph = st.empty()
+            st.subheader("議事録")
+            minutes_ph = st.empty()
+            st.subheader("次回アジェンダ")
+            agenda_ph = st.empty()
+            placeholders[name] = dict(status=status, transcript=transcript_ph, minutes=minutes_ph, agenda=agenda_ph)
+    streamed = {name: {"minutes": "", "agenda": ""} for name in placeholders}
+
+    with st.spinner("処理中です...しばらくお待ちください"), metrics.start_run(uploaded_audio.name) as run:
+        uploaded_audio.seek(0)
+        # 分割のために読むのと同時に元音声のハッシュを取る（cli.py の処理済み判定と同じ source_sha256 で保存する）
+        source_hash = hashlib.sha256()
+        chunk_paths = split_for_providers(
+            uploaded_audio, providers,
+            split_mode="silence" if split_mode.startswith("無音") else "fixed",
+            profile=profile,
+            chunk_length_sec=chunk_length_sec,
+            overlap_sec=overlap_sec,
+            original_filename=uploaded_audio.name,
+            hasher=source_hash,
+        )
+        # 文字起こし → 議事録・アジェンダ生成（プロバイダごとに並列）
+        for event in stream_pipelines(chunk_paths, providers, merge=merge_for(overlap_sec)):
+            ph = placeholders[event.name]
+            if event.kind == "transcript":
+                ph["transcript"].text_area("", event.text, height=200, key=f"transcript_{event.name}")
+            elif event.kind == "token":
+                streamed[event.name][event.field] += event.text
+                ph[event.field].markdown(streamed[event.name][event.field], unsafe_allow_html=True)
+            else:
+                result = event.result
+                if result.error:
+                    ph["status"].error(f"{result.name} の処理に失敗しました: {result.error}")
+                    continue
+                ph["status"].caption(f"処理時間: {result.elapsed:.1f} 秒")
+                ph["minutes"].markdown(result.minutes, unsafe_allow_html=True)
+                ph["agenda"].markdown(result.agenda, unsafe_allow_html=True)
+                db.save_minutes(f"{result.name} {dt.datetime.now():%Y-%m-%d %H:%M}", result.transcript, result.minutes,
+                                provider=result.name, source_sha256=source_hash.hexdigest())
+    stats = get_transcript_cache().stats()
+    st.caption(f"文字起こしキャッシュ: ヒット {stats['hits']} / ミス {stats['misses']}（保存 {stats['entries']} 件）")
+    with metrics_tab:
+        # 今回の実行の内訳（並列に動くため合計時間は実測時間より長くなりうる）
+        summary = run.summary()
+        st.caption(f"概算料金: ${sum(r['cost_usd'] for r in summary):.4f}（トークン数 × 公開単価の目安）")
+        st.dataframe(summary, use_container_width=True)
+        st.subheader("直近 30 日の傾向")
+        st.dataframe(metrics.get_store().stage_percentiles(days=30), use_container_width=True)
+
+# 未完了のタスク（次回アジェンダの生成にはここに残っているものだけを渡す）
 st.divider()
+open_tasks = db.fetch_open_tasks(limit=100)
+with st.expander(f"📌 未完了のタスク（{len(open_tasks)} 件）"):
+    if not open_tasks:
+        st.caption("未完了のタスクはありません。")
+    for task in open_tasks:
+        owner = "　".join(v for v in (task["assignee"], task["due"]) if v)
+        label = f"{task['text']}（★{owner or '未定'}）　{task['created_at']:%Y-%m-%d} {task['topic'] or task['title']}"
+        if st.checkbox(label, key=f"task_done_{task['id']}"):
+            db.set_task_status(task["id"], "done")
+            st.rerun()
+
+# 過去の議事録（1 ページ分のサマリだけ取得し、本文は開いたものだけ読み込む）
 st.subheader("📚 過去の議事録")
-for rec in db.fetch_all_minutes():
-    with st.expander(rec["title"]):
-        st.markdown(rec["minutes_md"], unsafe_allow_html=True)
-        st.text_area("文字起こしデータ", rec["transcript"], height=200)
-        st.caption(f"保存日時: {rec['created_at']:%Y-%m-%d %H:%M}")
+HISTORY_PAGE_SIZE = 20
+
+
+def render_history_item(rec: dict):
+    with st.expander(f"{rec['title']}（{rec['created_at']:%Y-%m-%d %H:%M}）"):
+        if rec.get("snippet"):
+            st.markdown(rec["snippet"])
+        else:
+            st.caption(f"文字起こし {rec['transcript_chars']:,} 文字 / 議事録 {rec['minutes_chars']:,} 文字")
+        if st.toggle("内容を表示", key=f"history_open_{rec['id']}"):
+            full = db.fetch_minutes(rec["id"])
+            st.markdown(full["minutes_md"], unsafe_allow_html=True)
+            st.text_area("文字起こしデータ", full["transcript"], height=200, key=f"history_transcript_{rec['id']}")
+            st.caption(f"保存日時: {full['created_at']:%Y-%m-%d %H:%M}")
+
+
+search_query = st.text_input("🔍 議事録・文字起こしを検索", placeholder="キーワード（空白区切りで AND 検索）")
+if search_query.strip():
+    hits = db.search_minutes(search_query, limit=HISTORY_PAGE_SIZE)
+    st.caption(f"{len(hits)} 件ヒット（関連度順・上位 {HISTORY_PAGE_SIZE} 件まで）")
+    for rec in hits:
+        render_history_item(rec)
+else:
+    # ページごとの開始カーソル（先頭ページは None）
+    page_cursors = st.session_state.setdefault("history_cursors", [None])
+    page_index = len(page_cursors) - 1
+    page = db.fetch_minutes_page(HISTORY_PAGE_SIZE, before=page_cursors[-1])
+    st.caption(f"全 {db.count_minutes()} 件中 {page_index * HISTORY_PAGE_SIZE + 1}〜{page_index * HISTORY_PAGE_SIZE + len(page)} 件目")
+    for rec in page:
+        render_history_item(rec)
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("← 新しい議事録", disabled=page_index == 0):
+        page_cursors.pop()
+        st.rerun()
+    if next_col.button("古い議事録 →", disabled=len(page) < HISTORY_PAGE_SIZE):
+        page_cursors.append(page[-1]["cursor"])
+        st.rerun()
 # 保存日時の表示
 st.caption(f"最終更新日時: {dt.datetime.now():%Y-%m-%d %H:%M}")
 # スタイル設定
@@ -155,4 +319,4 @@ st.markdown("""
         border-radius: 5px;
     }
 </style>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
@@ -2,10 +2,69 @@
 import subprocess
 import tempfile
 import os
+import math
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
 
 from imageio_ffmpeg import get_ffmpeg_exe
 
+import metrics
+
+
+# ─────────────────────────────────────────
+# エンコードプロファイル
+#   hq  : 従来の高音質ステレオ MP3
+#   asr_*: 音声認識向け（モノラル・16 kHz・低ビットレート）
+# ─────────────────────────────────────────
+@dataclass(frozen=True)
+class AudioProfile:
+    name: str
+    codec_args: tuple
+    bitrate_kbps: int    # チャンク長の算出に使う目安のビットレート（VBR は上限寄りの値）
+    suffix: str = ".mp3"
+
+
+AUDIO_PROFILES = {
+    "hq": AudioProfile("hq", ("-codec:a", "libmp3lame", "-q:a", "2"), 260),
+    "asr_mp3": AudioProfile(
+        "asr_mp3", ("-ac", "1", "-ar", "16000", "-codec:a", "libmp3lame", "-b:a", "32k"), 32),
+    "asr_opus": AudioProfile(
+        "asr_opus",
+        # Ogg はストリームのシリアル番号を乱数で決めるため、bitexact で毎回同じバイト列にする
+        # （チャンクの SHA-256 をキーにしたキャッシュ・アップロード再利用を効かせるため）
+        ("-ac", "1", "-ar", "16000", "-codec:a", "libopus", "-b:a", "24k", "-application", "voip",
+         "-fflags", "+bitexact", "-flags:a", "+bitexact"),
+        32, ".ogg"),
+}
+DEFAULT_PROFILE = "asr_mp3"
+
+
+def get_profile(profile: Union[str, AudioProfile]) -> AudioProfile:
+    return AUDIO_PROFILES[profile] if isinstance(profile, str) else profile
+
+
+def chunk_length_for(
+    profile: Union[str, AudioProfile],
+    max_bytes: int,
+    *,
+    max_seconds: Optional[int] = None,
+    safety: float = 0.9,
+) -> int:
+    """
+    プロバイダのアップロード上限（バイト）に収まるチャンク長（秒）を返す。
+    max_seconds があれば（モデルの音声長上限など）そちらでも頭打ちにする。
+    """
+    prof = get_profile(profile)
+    seconds = int(max_bytes * 8 * safety / (prof.bitrate_kbps * 1000))
+    if max_seconds is not None:
+        seconds = min(seconds, max_seconds)
+    return max(seconds, 1)
+
 def convert_m4a_to_mp3(input_bytes: bytes, original_filename: str) -> (bytes, str):
     """
     M4Aバイト列をMP3バイト列に変換し、そのバイト列と出力ファイル名を返す。
@@ -23,18 +82,19 @@ def convert_m4a_to_mp3(input_bytes: bytes, original_filename: str) -> (bytes, st
     # ffmpeg のパスを取得
     ffmpeg_path = get_ffmpeg_exe()
 
-    # ffmpeg コマンドを構築 (高音質設定)
+    # ffmpeg コマンドを構築 (高音質設定: libmp3lame -q:a 2)
     cmd = [
         ffmpeg_path,
         "-y",  # 上書き許可
         "-i", str(in_path),
-        "-codec:a", "libmp3lame",
-        "-q:a", "2",  # 品質パラメータ(2 が高音質の目安)
+        *AUDIO_PROFILES["hq"].codec_args,
         str(out_path)
     ]
 
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with metrics.span("convert", bytes_in=len(input_bytes)) as sp:
+            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            sp.bytes_out = out_path.stat().st_size
     except subprocess.CalledProcessError as e:
         stderr = e.stderr.decode(errors="ignore") if e.stderr else ""
         raise RuntimeError(f"ffmpegでの変換に失敗しました:\n{stderr}")
@@ -94,3 +154,281 @@ def split_mp3_to_chunks(mp3_path: Path, chunk_length_sec: int = 20 * 60) -> list
     # 出力ディレクトリから .mp3 ファイルをソートして取得
     chunk_files = sorted(tmp_dir.glob("chunk_*.mp3"))
     return chunk_files
+
+
+# 標準入力から読むと moov atom が末尾にある場合に失敗するコンテナ（一時ファイル経由で渡す）
+_NEEDS_SEEK_SUFFIXES = {".m4a", ".mp4", ".mov", ".3gp"}
+
+
+class _CountingReader:
+    """ffmpeg の stdin へ流したバイト数を数える（hasher があれば読んだバイト列で update する）ラッパー"""
+    def __init__(self, f: BinaryIO, hasher=None):
+        self._f = f
+        self._hasher = hasher
+        self.bytes_read = 0
+
+    def read(self, n: int = -1) -> bytes:
+        data = self._f.read(n)
+        self.bytes_read += len(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
+        return data
+
+
+def stream_audio_chunks(
+    source: Union[Path, str, BinaryIO],
+    *,
+    original_filename: str = "",
+    profile: Union[str, AudioProfile] = DEFAULT_PROFILE,
+    chunk_length_sec: Optional[int] = None,
+    max_bytes: int = 25 * 1024 * 1024,
+    hasher=None,
+) -> Iterator[Path]:
+    """
+    音声を 1 回の ffmpeg 呼び出しで変換＋チャンク分割し、書き終わったチャンクから順に Path を yield する。
+    - source はファイルパスまたはバイナリのファイルオブジェクト（Streamlit の UploadedFile など）
+    - ファイルオブジェクトは ffmpeg の stdin へブロック単位で流し込む（全体をメモリに複製しない）
+    - hasher（hashlib.sha256() など）を渡すと、ファイルオブジェクトから読んだバイト列で update する
+      （流し込みと同時に元音声のハッシュを取る。最後のチャンクを yield し終えた時点で確定する）
+    - m4a など stdin から読めないコンテナは、一度だけ一時ファイルへストリームコピーしてから渡す
+    - profile でエンコード設定を選ぶ（hq プロファイルの MP3 入力は再エンコードせずに分割のみ）
+    - chunk_length_sec を省略すると、max_bytes に収まる長さをプロファイルのビットレートから算出する
+    戻り値の各 Path は一時ファイルであり、不要になったら削除してください。
+    """
+    prof = get_profile(profile)
+    if chunk_length_sec is None:
+        chunk_length_sec = chunk_length_for(prof, max_bytes)
+
+    ffmpeg_path = get_ffmpeg_exe()
+    tmp_dir = Path(tempfile.mkdtemp(prefix="mp3_chunks_"))
+    out_pattern = str(tmp_dir / f"chunk_%03d{prof.suffix}")
+
+    if isinstance(source, (str, Path)):
+        suffix = Path(source).suffix.lower()
+    else:
+        suffix = Path(original_filename or getattr(source, "name", "")).suffix.lower()
+
+    feed = None
+    spooled = None
+    if isinstance(source, (str, Path)):
+        input_arg = str(source)
+    elif suffix in _NEEDS_SEEK_SUFFIXES:
+        spooled = tmp_dir / f"source{suffix}"
+        with metrics.span("spool") as sp, open(spooled, "wb") as f:
+            shutil.copyfileobj(_CountingReader(source, hasher), f, 1 << 20)
+            sp.bytes_in = sp.bytes_out = f.tell()
+        input_arg = str(spooled)
+    else:
+        feed = _CountingReader(source, hasher)
+        input_arg = "pipe:0"
+
+    copy_only = prof.name == "hq" and suffix == ".mp3"
+    codec = ["-c", "copy"] if copy_only else list(prof.codec_args)
+    cmd = [
+        ffmpeg_path,
+        "-y",
+        "-loglevel", "error",
+        "-i", input_arg,
+        "-vn",
+        *codec,
+        "-f", "segment",
+        "-segment_time", str(chunk_length_sec),
+        "-reset_timestamps", "1",
+        # 完成したセグメント名を 1 行ずつ stdout へ書き出させる
+        "-segment_list", "pipe:1",
+        "-segment_list_type", "flat",
+        out_pattern,
+    ]
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if feed is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    stderr_buf = []
+    readers = [threading.Thread(target=lambda: stderr_buf.append(proc.stderr.read()), daemon=True)]
+    if feed is not None:
+        def _feed():
+            try:
+                shutil.copyfileobj(feed, proc.stdin, 1 << 20)
+            except (BrokenPipeError, ValueError):
+                pass  # ffmpeg が先に終了した（エラーは終了コードで検出する）
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+        readers.append(threading.Thread(target=_feed, daemon=True))
+    for t in readers:
+        t.start()
+
+    finished = False
+    try:
+        # 変換＋分割の開始から ffmpeg の終了までを 1 つの区間として計測する
+        with metrics.span("split") as sp:
+            for line in proc.stdout:
+                name = line.decode(errors="ignore").strip()
+                if name:
+                    chunk = tmp_dir / name
+                    sp.bytes_out += chunk.stat().st_size
+                    yield chunk
+            returncode = proc.wait()
+            for t in readers:
+                t.join()
+            finished = True
+            sp.bytes_in = feed.bytes_read if feed is not None else Path(input_arg).stat().st_size
+            if returncode != 0:
+                stderr = b"".join(stderr_buf).decode(errors="ignore")
+                raise RuntimeError(f"ffmpeg での変換・チャンク分割に失敗しました:\n{stderr}")
+    finally:
+        if not finished:
+            # 呼び出し側が途中で反復をやめた場合は ffmpeg を止める
+            proc.kill()
+            proc.wait()
+        if spooled is not None:
+            try:
+                os.remove(spooled)
+            except OSError:
+                pass
+
+
+# ─────────────────────────────────────────
+# 無音位置での分割
+# ─────────────────────────────────────────
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_SILENCE_RE = re.compile(r"silence_(start|end):\s*(-?\d+(?:\.\d+)?)")
+
+
+def probe_duration(audio_path: Path) -> float:
+    """ffmpeg のヘッダ情報から音声の長さ（秒）を返す"""
+    with metrics.span("probe", bytes_in=Path(audio_path).stat().st_size):
+        proc = subprocess.run(
+            [get_ffmpeg_exe(), "-hide_banner", "-i", str(audio_path)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+    m = _DURATION_RE.search(proc.stderr.decode(errors="ignore"))
+    if not m:
+        raise RuntimeError(f"音声の長さを取得できませんでした: {audio_path}")
+    h, mi, sec = m.groups()
+    return int(h) * 3600 + int(mi) * 60 + float(sec)
+
+
+def detect_silences(
+    audio_path: Path, *, noise_db: float = -35.0, min_silence_sec: float = 0.5
+) -> List[Tuple[float, float]]:
+    """silencedetect で無音区間 (開始秒, 終了秒) のリストを返す"""
+    cmd = [
+        get_ffmpeg_exe(), "-hide_banner", "-nostats",
+        "-i", str(audio_path),
+        "-vn",
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_silence_sec}",
+        "-f", "null", "-",
+    ]
+    try:
+        with metrics.span("silence_detect", bytes_in=Path(audio_path).stat().st_size):
+            proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode(errors="ignore") if e.stderr else ""
+        raise RuntimeError(f"ffmpeg での無音検出に失敗しました:\n{stderr}")
+
+    silences, start = [], None
+    for kind, value in _SILENCE_RE.findall(proc.stderr.decode(errors="ignore")):
+        if kind == "start":
+            start = max(float(value), 0.0)
+        elif start is not None:
+            silences.append((start, float(value)))
+            start = None
+    return silences
+
+
+def plan_cut_points(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    n_chunks: int,
+    *,
+    search_sec: Optional[float] = None,
+) -> List[float]:
+    """
+    音声を n_chunks 等分した位置の近く（±search_sec）にある無音区間の中央を切れ目に選ぶ。
+    近くに無音がなければ等分位置でそのまま切る。戻り値は先頭 0 と末尾 duration を含む昇順リスト。
+    """
+    if n_chunks <= 1:
+        return [0.0, duration]
+    even = duration / n_chunks
+    if search_sec is None:
+        search_sec = even * 0.1
+    mids = [(s + e) / 2 for s, e in silences]
+    cuts = [0.0]
+    for i in range(1, n_chunks):
+        ideal = even * i
+        near = [m for m in mids if abs(m - ideal) <= search_sec and m > cuts[-1]]
+        cuts.append(min(near, key=lambda m: abs(m - ideal)) if near else ideal)
+    cuts.append(duration)
+    return cuts
+
+
+def split_on_silence(
+    audio_path: Path,
+    *,
+    target_sec: Optional[float] = None,
+    n_chunks: Optional[int] = None,
+    max_sec: Optional[float] = None,
+    min_sec: float = 60.0,
+    overlap_sec: float = 0.0,
+    profile: Union[str, AudioProfile] = DEFAULT_PROFILE,
+    max_workers: int = 4,
+) -> List[Path]:
+    """
+    無音位置の近くで切れ目を選び、ほぼ均等な長さのチャンクに分割して Path のリストを返す。
+    - target_sec（1 チャンクの目安の長さ）か n_chunks（チャンク数）で分割数を決める
+      並列ワーカー数に合わせて n_chunks を指定すると作業量が均等になる
+    - min_sec より短くならないよう分割数を減らし、max_sec（上限）を超えるチャンクができないよう増やす
+      （両立しないときは max_sec を守る）
+    - overlap_sec を指定すると各チャンクの先頭を前のチャンクと重ねる（merge_transcripts で重複を除去）
+    - 各チャンクの切り出し・エンコードは max_workers 並列で行う
+    戻り値の各 Path は一時ファイルであり、不要になったら削除してください。
+    """
+    prof = get_profile(profile)
+    duration = probe_duration(audio_path)
+
+    if n_chunks is None:
+        n_chunks = math.ceil(duration / target_sec) if target_sec else 1
+    n_chunks = max(1, min(n_chunks, int(duration // min_sec) or 1))
+    search_sec = None
+    if max_sec:
+        # max_sec はプロバイダの上限なので min_sec より優先する。
+        # 切れ目が無音側へずれても、重なりを足しても max_sec を超えないよう余裕を持たせる
+        n_chunks = max(n_chunks, math.ceil(duration / (max_sec * 0.9)))
+        even = duration / n_chunks
+        search_sec = max(0.0, min(even * 0.1, (max_sec - overlap_sec - even) / 2))
+
+    silences = detect_silences(audio_path) if n_chunks > 1 else []
+    cuts = plan_cut_points(duration, silences, n_chunks, search_sec=search_sec)
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="mp3_chunks_"))
+    copy_only = prof.name == "hq" and Path(audio_path).suffix.lower() == ".mp3"
+    codec = ["-c", "copy"] if copy_only else list(prof.codec_args)
+
+    def _cut(i: int) -> Path:
+        start = max(cuts[i] - (overlap_sec if i > 0 else 0.0), 0.0)
+        end = cuts[i + 1]
+        out = tmp_dir / f"chunk_{i:03d}{prof.suffix}"
+        cmd = [
+            get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-ss", f"{start:.3f}", "-to", f"{end:.3f}",
+            "-i", str(audio_path),
+            "-vn", *codec,
+            str(out),
+        ]
+        try:
+            with metrics.span("cut") as sp:
+                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                sp.bytes_out = out.stat().st_size
+        except subprocess.CalledProcessError as e:
+            stderr = e.stderr.decode(errors="ignore") if e.stderr else ""
+            raise RuntimeError(f"ffmpeg でチャンク分割に失敗しました:\n{stderr}")
+        return out
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        return list(ex.map(metrics.bind(_cut), range(len(cuts) - 1)))
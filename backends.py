@@ -0,0 +1,266 @@
+"""backends.py – 文字起こし・議事録生成バックエンドの共通インターフェースと登録簿
+
+core_openai / core_gemini のように Backend と同じ名前の関数・定数を持つモジュール
+（またはオブジェクト）を名前で登録し、pipeline.Provider を組み立てる。
+有効にするバックエンドは環境変数または st.secrets の ENABLED_BACKENDS（カンマ区切り）で指定し、
+コードを変えずに追加するときは BACKENDS="名前=モジュール[:ファクトリ]" で登録する。
+LocalBackend はネットワークを使わない決定的なバックエンドで、負荷試験・ベンチマーク用
+（定型の議事録・タスクが本番の DB に入らないよう、DEV_BACKENDS=1 のときだけ選択肢に出す）。
+"""
+from pathlib import Path
+import importlib
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Protocol, Sequence
+
+import metrics
+from audio_utils import chunk_length_for
+from cache import file_sha256
+from pipeline import Provider
+from templates import AGENDA_PROMPT, MINUTES_PROMPT
+
+DEFAULT_BACKENDS = "OpenAI,Gemini"
+OPEN_TASKS_LIMIT = 50  # アジェンダ生成に渡す未完了タスクの件数
+
+
+class Backend(Protocol):
+    MAX_CONCURRENCY: int             # 文字起こしの同時リクエスト数
+    MAX_UPLOAD_BYTES: int            # 1 チャンクのファイルサイズ上限
+    MAX_AUDIO_SECONDS: Optional[int]  # 1 チャンクの音声長上限（なければ None）
+
+    def transcribe_audio(self, audio_path: Path, *, lang: str = "ja") -> str: ...
+
+    def generate_minutes(self, transcript: str, template_str: str, *, use_cache: bool = True) -> str: ...
+
+    def generate_minutes_stream(self, transcript: str, template_str: str, *,
+                                use_cache: bool = True) -> Iterator[str]: ...
+
+    def generate_next_agenda(self, transcript: str, template_str: str, open_tasks: List[Dict], *,
+                             use_cache: bool = True) -> str: ...
+
+    def generate_next_agenda_stream(self, transcript: str, template_str: str, open_tasks: List[Dict], *,
+                                    use_cache: bool = True) -> Iterator[str]: ...
+
+    # 任意: prefetch_upload(audio_path) があればチャンクが届いた時点で呼ぶ（Provider.prepare）
+
+
+# ─────────────────────────────────────────
+# ローカルのスタンドイン
+#   固定の待ち時間と定型出力だけを返す。同じ音声なら同じ文字起こしになる
+# ─────────────────────────────────────────
+class LocalBackend:
+    MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+    MAX_AUDIO_SECONDS = 1400
+
+    def __init__(self, *, transcribe_latency: Optional[float] = None, generate_latency: Optional[float] = None,
+                 token_latency: Optional[float] = None, max_concurrency: Optional[int] = None):
+        """
+        transcribe_latency : 1 チャンクの文字起こしにかける秒数
+        generate_latency   : 生成の最初のトークンまでの秒数
+        token_latency      : ストリーミング時のトークン間隔（秒）
+        未指定の値は環境変数 LOCAL_TRANSCRIBE_LATENCY などから読む
+        """
+        def _env(name: str, default: float) -> float:
+            return float(os.getenv(name, default))
+        self.transcribe_latency = _env("LOCAL_TRANSCRIBE_LATENCY", 0.5) if transcribe_latency is None else transcribe_latency
+        self.generate_latency = _env("LOCAL_GENERATE_LATENCY", 1.0) if generate_latency is None else generate_latency
+        self.token_latency = _env("LOCAL_TOKEN_LATENCY", 0.01) if token_latency is None else token_latency
+        self.MAX_CONCURRENCY = int(_env("LOCAL_MAX_CONCURRENCY", 4) if max_concurrency is None else max_concurrency)
+
+    def transcribe_audio(self, audio_path: Path, *, lang: str = "ja") -> str:
+        size = Path(audio_path).stat().st_size
+        with metrics.span("transcribe", provider="local", bytes_in=size) as sp:
+            time.sleep(self.transcribe_latency)
+            text = f"（ローカル文字起こし {file_sha256(audio_path)[:8]} {size} bytes）。"
+            sp.bytes_out = len(text.encode())
+        return text
+
+    def _minutes_text(self, transcript: str) -> str:
+        return (
+            "## 📄 会議議事録（ローカル）\n\n"
+            f"### 議題1：文字起こし {len(transcript)} 文字の要約\n"
+            "　- ◆ 定型の決定事項<br>\n"
+            "　- 定型のタスク（★担当者　期限）<br>\n"
+        )
+
+    def _agenda_text(self, transcript: str) -> str:
+        return (
+            "## 🗓️ 次回アジェンダ案（ローカル）\n\n"
+            "### 1. 前回宿題事項の確認\n　- 定型のタスク（★担当者　期限）<br>\n"
+            f"### 2. 次回アジェンダ案\n　- 文字起こし {len(transcript)} 文字の続き<br>\n"
+        )
+
+    def _stream(self, stage: str, transcript: str, text: str) -> Iterator[str]:
+        with metrics.span(stage, provider="local", bytes_in=len(transcript.encode())) as sp:
+            time.sleep(self.generate_latency)
+            for i in range(0, len(text), 8):
+                if i:
+                    time.sleep(self.token_latency)
+                sp.bytes_out += len(text[i:i + 8].encode())
+                yield text[i:i + 8]
+
+    def _generate(self, stage: str, transcript: str, text: str) -> str:
+        with metrics.span(stage, provider="local", bytes_in=len(transcript.encode())) as sp:
+            time.sleep(self.generate_latency)
+            sp.bytes_out = len(text.encode())
+        return text
+
+    def generate_minutes(self, transcript: str, template_str: str, *, use_cache: bool = True) -> str:
+        return self._generate("minutes", transcript, self._minutes_text(transcript))
+
+    def generate_minutes_stream(self, transcript: str, template_str: str, *,
+                                use_cache: bool = True) -> Iterator[str]:
+        return self._stream("minutes", transcript, self._minutes_text(transcript))
+
+    def generate_next_agenda(self, transcript: str, template_str: str, open_tasks: List[Dict], *,
+                             use_cache: bool = True) -> str:
+        return self._generate("agenda", transcript, self._agenda_text(transcript))
+
+    def generate_next_agenda_stream(self, transcript: str, template_str: str, open_tasks: List[Dict], *,
+                                    use_cache: bool = True) -> Iterator[str]:
+        return self._stream("agenda", transcript, self._agenda_text(transcript))
+
+
+# ─────────────────────────────────────────
+# 登録簿
+#   モジュールの import（SDK の読み込み）は初めて使うときまで遅らせる
+#   設定（環境変数 → st.secrets の順に読む）:
+#     ENABLED_BACKENDS : 既定で使うバックエンド名（カンマ区切り）
+#     BACKENDS         : 追加のバックエンド（"名前=モジュール[:ファクトリ]" のカンマ区切り）
+#     DEV_BACKENDS     : 1 なら開発用（Local）も選択肢に出す
+# ─────────────────────────────────────────
+_factories: Dict[str, Callable[[], Backend]] = {}
+_instances: Dict[str, Backend] = {}
+_dev_backends = set()
+_configured = False
+_lock = threading.Lock()
+_configure_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[], Backend], *, dev: bool = False):
+    """name でバックエンドを登録する（同名があれば置き換える）。
+       dev=True のものは DEV_BACKENDS か ENABLED_BACKENDS で指定したときだけ選択肢に出す
+    """
+    with _lock:
+        _factories[name] = factory
+        _instances.pop(name, None)
+        if dev:
+            _dev_backends.add(name)
+        else:
+            _dev_backends.discard(name)
+
+
+register_backend("OpenAI", lambda: importlib.import_module("core_openai"))
+register_backend("Gemini", lambda: importlib.import_module("core_gemini"))
+register_backend("Local", LocalBackend, dev=True)
+
+
+def _setting(key: str) -> Optional[str]:
+    value = os.getenv(key)
+    if value is None:
+        try:
+            import streamlit as st
+            value = st.secrets.get(key)
+        except Exception:  # noqa: BLE001 – secrets.toml がなければ未設定
+            value = None
+    return value
+
+
+def _spec_factory(spec: str) -> Callable[[], Backend]:
+    """"モジュール[:ファクトリ]" からバックエンドを作る関数（ファクトリがなければモジュールそのもの）"""
+    module_name, _, attr = spec.partition(":")
+
+    def _load() -> Backend:
+        module = importlib.import_module(module_name)
+        return getattr(module, attr)() if attr else module
+    return _load
+
+
+def _register_configured():
+    """BACKENDS に書かれたバックエンドを初回だけ登録する"""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+        for entry in (_setting("BACKENDS") or "").split(","):
+            if not entry.strip():
+                continue
+            name, _, spec = (part.strip() for part in entry.partition("="))
+            if not name or not spec:
+                raise ValueError(f"BACKENDS の書式が正しくありません: {entry!r}（名前=モジュール[:ファクトリ]）")
+            register_backend(name, _spec_factory(spec))
+
+
+def available_backends() -> List[str]:
+    """選択肢に出すバックエンド名（開発用は DEV_BACKENDS=1 か ENABLED_BACKENDS で指定したときだけ）"""
+    enabled = set(enabled_backends())
+    show_dev = (_setting("DEV_BACKENDS") or "").strip().lower() in ("1", "true", "yes")
+    with _lock:
+        return [n for n in _factories if show_dev or n not in _dev_backends or n in enabled]
+
+
+def get_backend(name: str) -> Backend:
+    _register_configured()
+    with _lock:
+        if name not in _factories:
+            raise KeyError(f"未登録のバックエンドです: {name}（登録済み: {', '.join(_factories)}）")
+        if name not in _instances:
+            _instances[name] = _factories[name]()
+        return _instances[name]
+
+
+def enabled_backends() -> List[str]:
+    """ENABLED_BACKENDS（環境変数 → st.secrets の順）で有効にするバックエンド名を返す"""
+    _register_configured()
+    value = _setting("ENABLED_BACKENDS")
+    names = [n.strip() for n in (value or DEFAULT_BACKENDS).split(",") if n.strip()]
+    with _lock:
+        unknown = [n for n in names if n not in _factories]
+    if unknown:
+        raise ValueError(f"ENABLED_BACKENDS に未登録の名前があります: {', '.join(unknown)}")
+    return names
+
+
+def open_tasks_snapshot(db) -> List[Dict]:
+    """アジェンダ生成に渡す未完了タスクを、パイプライン開始前に一度だけ読む
+       （先に終わったプロバイダが今回の議事録を保存しても、他のプロバイダのアジェンダに混ざらないように）
+    """
+    return db.fetch_open_tasks(limit=OPEN_TASKS_LIMIT) if db is not None else []
+
+
+def build_provider(name: str, db, *, use_cache: bool = True, open_tasks: Optional[List[Dict]] = None,
+                   minutes_prompt: str = MINUTES_PROMPT, agenda_prompt: str = AGENDA_PROMPT) -> Provider:
+    backend = get_backend(name)
+    if open_tasks is None:
+        open_tasks = open_tasks_snapshot(db)
+    return Provider(
+        name=name,
+        transcribe=backend.transcribe_audio,
+        generate_minutes=lambda t: backend.generate_minutes(t, minutes_prompt, use_cache=use_cache),
+        generate_next_agenda=lambda t: backend.generate_next_agenda(t, agenda_prompt, open_tasks,
+                                                                    use_cache=use_cache),
+        max_concurrency=backend.MAX_CONCURRENCY,
+        stream_minutes=lambda t: backend.generate_minutes_stream(t, minutes_prompt, use_cache=use_cache),
+        stream_next_agenda=lambda t: backend.generate_next_agenda_stream(t, agenda_prompt, open_tasks,
+                                                                         use_cache=use_cache),
+        prepare=getattr(backend, "prefetch_upload", None),
+    )
+
+
+def chunk_length_for_backends(names: Optional[Sequence[str]], profile: str) -> int:
+    """全プロバイダの上限（サイズ・音声長）を満たす最短のチャンク長（秒）"""
+    return min(
+        chunk_length_for(profile, backend.MAX_UPLOAD_BYTES, max_seconds=backend.MAX_AUDIO_SECONDS)
+        for backend in map(get_backend, names or enabled_backends())
+    )
+
+
+def build_providers(names: Optional[Sequence[str]], db, *, use_cache: bool = True) -> List[Provider]:
+    """names のバックエンドから Provider を作る（None なら enabled_backends()）。
+       未完了タスクは全プロバイダで同じスナップショットを使う
+    """
+    open_tasks = open_tasks_snapshot(db)
+    return [build_provider(name, db, use_cache=use_cache, open_tasks=open_tasks)
+            for name in (names or enabled_backends())]
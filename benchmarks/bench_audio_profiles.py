@@ -0,0 +1,88 @@
+"""bench_audio_profiles.py – エンコードプロファイルごとの出力サイズと ffmpeg 時間を比べる
+
+トーン＋ノイズの合成音声（ステレオ 44.1 kHz の m4a）を生成し、各プロファイルで
+stream_audio_chunks を通したときの合計バイト数・チャンク数・処理時間を表示する。
+あわせて、同じファイルを 2 回分割（固定長・無音）してチャンクの SHA-256 が一致するかを確かめる
+（一致しないとチャンクハッシュをキーにしたキャッシュが当たらない）。
+
+    python benchmarks/bench_audio_profiles.py --minutes 10
+"""
+from pathlib import Path
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from imageio_ffmpeg import get_ffmpeg_exe  # noqa: E402
+
+from audio_utils import AUDIO_PROFILES, chunk_length_for, split_on_silence, stream_audio_chunks  # noqa: E402
+from cache import file_sha256  # noqa: E402
+from bench_common import isolate_data_dir  # noqa: E402
+
+
+def make_synthetic(minutes: float) -> Path:
+    out = Path(tempfile.mkdtemp(prefix="bench_audio_")) / "synthetic.m4a"
+    sec = int(minutes * 60)
+    cmd = [
+        get_ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=44100:duration={sec}",
+        "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.1:sample_rate=44100:duration={sec}",
+        "-filter_complex", "[0][1]amix=inputs=2,aformat=channel_layouts=stereo",
+        "-c:a", "aac", "-b:a", "128k",
+        str(out),
+    ]
+    subprocess.run(cmd, check=True)
+    return out
+
+
+def chunk_hashes(src: Path, profile: str, split: str, chunk_sec: int) -> list:
+    if split == "silence":
+        chunks = split_on_silence(src, n_chunks=2, max_sec=chunk_sec, min_sec=1, profile=profile)
+    else:
+        chunks = list(stream_audio_chunks(src, profile=profile, chunk_length_sec=chunk_sec))
+    hashes = [file_sha256(p) for p in chunks]
+    for p in chunks:
+        p.unlink()
+    return hashes
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, default=10)
+    ap.add_argument("--max-bytes", type=int, default=25 * 1024 * 1024,
+                    help="チャンク長の算出に使うアップロード上限（既定: OpenAI の 25 MB）")
+    args = ap.parse_args()
+    isolate_data_dir("bench_audio_profiles_")
+
+    src = make_synthetic(args.minutes)
+    print(f"source: {src.stat().st_size / 1e6:.1f} MB ({args.minutes:g} min, stereo 44.1 kHz AAC)")
+    print(f"{'profile':<10} {'MB':>8} {'MB/hour':>9} {'chunk s':>8} {'ffmpeg s':>9}")
+    for name in AUDIO_PROFILES:
+        t0 = time.perf_counter()
+        chunks = list(stream_audio_chunks(src, profile=name, chunk_length_sec=10 ** 6))
+        elapsed = time.perf_counter() - t0
+        size = sum(p.stat().st_size for p in chunks)
+        for p in chunks:
+            p.unlink()
+        per_hour = size / 1e6 * 60 / args.minutes
+        print(f"{name:<10} {size / 1e6:8.2f} {per_hour:9.1f} "
+              f"{chunk_length_for(name, args.max_bytes):8d} {elapsed:9.2f}")
+
+    print()
+    chunk_sec = max(1, int(args.minutes * 60 / 3))
+    unstable = []
+    for name in AUDIO_PROFILES:
+        for split in ("fixed", "silence"):
+            first, second = (chunk_hashes(src, name, split, chunk_sec) for _ in range(2))
+            stable = first == second
+            print(f"{name:<10} {split:<8} {len(first):3d} chunks  hashes {'stable' if stable else 'DIFFER'}")
+            if not stable:
+                unstable.append(f"{name}/{split}")
+    assert not unstable, f"同じ入力でチャンクのハッシュが変わるプロファイル: {', '.join(unstable)}"
+
+
+if __name__ == "__main__":
+    main()
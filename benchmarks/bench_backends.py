@@ -0,0 +1,89 @@
+"""bench_backends.py – LocalBackend でパイプライン全体を回し、API 待ち以外のオーバーヘッドを測る
+
+合成音声を stream_audio_chunks で分割し、N 個の LocalBackend（固定の待ち時間・定型出力）を
+stream_pipelines で同時に実行する。ネットワークは使わない。
+- wall     : 音声変換から全プロバイダの完了までの実測時間
+- ideal    : 待ち時間だけから計算した下限（ceil(チャンク数 / 同時数) × 文字起こし + 生成）
+- overhead : wall - ideal（ffmpeg・スレッド・イベント配送など自前の処理にかかった時間）
+- 参考として、分割（ffmpeg）だけを単独で実行したときの時間も表示する
+
+    python benchmarks/bench_backends.py --minutes 30 --providers 1 2 4 8
+"""
+from pathlib import Path
+import argparse
+import math
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from imageio_ffmpeg import get_ffmpeg_exe  # noqa: E402
+
+from audio_utils import stream_audio_chunks  # noqa: E402
+from backends import LocalBackend, build_providers, register_backend  # noqa: E402
+from pipeline import stream_pipelines  # noqa: E402
+from bench_common import isolate_data_dir  # noqa: E402
+
+
+def make_synthetic(minutes: float) -> Path:
+    out = Path(tempfile.mkdtemp(prefix="bench_backends_")) / "synthetic.mp3"
+    cmd = [get_ffmpeg_exe(), "-y", "-loglevel", "error",
+           "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=16000:duration={int(minutes * 60)}",
+           "-ac", "1", "-b:a", "32k", str(out)]
+    subprocess.run(cmd, check=True)
+    return out
+
+
+def time_split(src: Path, chunk_sec: int) -> float:
+    t0 = time.perf_counter()
+    for path in stream_audio_chunks(src, profile="asr_mp3", chunk_length_sec=chunk_sec):
+        path.unlink()
+    return time.perf_counter() - t0
+
+
+def run(src: Path, n_providers: int, args) -> tuple:
+    names = [f"Local{i}" for i in range(n_providers)]
+    for name in names:
+        register_backend(name, lambda: LocalBackend(
+            transcribe_latency=args.transcribe_latency, generate_latency=args.generate_latency,
+            token_latency=0.0, max_concurrency=args.concurrency))
+    providers = build_providers(names, None, use_cache=False)
+    t0 = time.perf_counter()
+    chunks = stream_audio_chunks(src, profile="asr_mp3", chunk_length_sec=args.chunk_sec)
+    events = n_chunks = 0
+    for event in stream_pipelines(chunks, providers):
+        events += 1
+        if event.kind == "done":
+            if event.result.error:
+                raise event.result.error
+            n_chunks = event.result.transcript.count("ローカル文字起こし")
+    wall = time.perf_counter() - t0
+    ideal = math.ceil(n_chunks / args.concurrency) * args.transcribe_latency + args.generate_latency
+    return n_chunks, events, wall, ideal
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, default=30)
+    ap.add_argument("--chunk-sec", type=int, default=120)
+    ap.add_argument("--providers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--transcribe-latency", type=float, default=0.5)
+    ap.add_argument("--generate-latency", type=float, default=1.0)
+    args = ap.parse_args()
+    isolate_data_dir("bench_backends_")
+
+    src = make_synthetic(args.minutes)
+    print(f"{args.minutes:g} min audio, {args.chunk_sec}s chunks, {args.concurrency} concurrent/provider, "
+          f"latency transcribe {args.transcribe_latency}s / generate {args.generate_latency}s")
+    print(f"ffmpeg split alone: {time_split(src, args.chunk_sec):.2f} s")
+    print(f"{'providers':>9} {'chunks':>7} {'events':>7} {'wall s':>8} {'ideal s':>8} {'overhead s':>11}")
+    for n in args.providers:
+        n_chunks, events, wall, ideal = run(src, n, args)
+        print(f"{n:9d} {n_chunks:7d} {events:7d} {wall:8.2f} {ideal:8.2f} {wall - ideal:11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""bench_common.py – ベンチマーク共通の下準備
+
+    from bench_common import isolate_data_dir, build_db, timeit
+    isolate_data_dir("bench_backends_")   # 計測・キャッシュの保存先を一時ディレクトリへ向ける
+    db = build_db(path, rows=1000, transcript_chars=20000)   # save_minutes 経由で合成データの DB を作る
+    timeit(db.fetch_all_minutes, repeat=5)                   # 中央値（ミリ秒）
+"""
+from pathlib import Path
+import atexit
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db import MinutesDB  # noqa: E402
+
+WORDS = ["会議", "予算", "資料", "確認", "次回", "担当", "期限", "議題", "決定", "共有", "営業", "開発",
+         "採用", "広報", "品質", "顧客", "契約", "報告", "計画", "課題", "見積もり", "スケジュール"]
+CHARS_PER_HOUR = 18_000  # 日本語の会話はおよそ 300 文字/分
+PROVIDERS = ("OpenAI", "Gemini")
+TEXT_POOL_SIZE = 50  # 合成する本文の種類（全行を別々に作ると件数が多いときに作成が遅い）
+
+
+def isolate_data_dir(prefix: str = "bench_") -> Path:
+    """metrics.sqlite3 と cache.sqlite3 を一時ディレクトリに作らせ、終了時に削除する
+       （偽サーバー・LocalBackend の結果で本番の data/ の p50 / p95 やキャッシュを汚さないため）。
+       get_store() / get_*_cache() を最初に呼ぶ前に実行すること。
+    """
+    data_dir = Path(tempfile.mkdtemp(prefix=prefix))
+    os.environ["METRICS_DB_PATH"] = str(data_dir / "metrics.sqlite3")
+    os.environ["CACHE_DB_PATH"] = str(data_dir / "cache.sqlite3")
+    atexit.register(shutil.rmtree, data_dir, ignore_errors=True)
+    return data_dir
+
+
+def make_text(rng: random.Random, chars: int) -> str:
+    """WORDS を並べた 5〜15 語の文を chars 文字以上になるまでつなげる"""
+    sentences, total = [], 0
+    while total < chars:
+        sentence = "".join(rng.choice(WORDS) for _ in range(rng.randint(5, 15))) + "。"
+        sentences.append(sentence)
+        total += len(sentence)
+    return "".join(sentences)
+
+
+def make_minutes(rng: random.Random) -> str:
+    """MINUTES_PROMPT の形（議題見出し・◆決定事項・★タスク）の議事録"""
+    lines = ["## 📄 会議議事録"]
+    for i in range(1, 6):
+        lines.append(f"### 議題{i}：{rng.choice(WORDS)}について")
+        lines += [f"　- ◆ {make_text(rng, 30)}<br>", f"　- {make_text(rng, 40)}（★{rng.choice(WORDS)}　10/31）<br>"]
+    return "\n".join(lines)
+
+
+def build_db(path: Path, rows: int, transcript_chars: int, *, seed: int = 0) -> MinutesDB:
+    """MinutesDB.save_minutes（圧縮・文字数・全文検索の索引まで本番と同じ経路）で合成データの DB を作る"""
+    db = MinutesDB(path)
+    # 1 件ごとの commit の fsync を省いて作成だけを速める（読み出しの計測には影響しない）
+    db.conn.execute("PRAGMA synchronous=OFF")
+    rng = random.Random(seed)
+    pool = [make_text(rng, transcript_chars) for _ in range(min(rows, TEXT_POOL_SIZE))]
+    for i in range(rows):
+        transcript = pool[i % len(pool)]
+        provider = PROVIDERS[i % len(PROVIDERS)]
+        db.save_minutes(f"{provider} 会議 {i}", transcript, transcript[: transcript_chars // 10], provider=provider)
+    db.conn.execute("PRAGMA synchronous=FULL")
+    return db
+
+
+def timeit(fn, repeat: int = 5) -> float:
+    """repeat 回の中央値（ミリ秒）"""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
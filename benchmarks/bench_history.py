@@ -0,0 +1,42 @@
+"""bench_history.py – 履歴表示 1 回あたりの DB 時間を件数ごとに比べる
+
+合成データ（長い文字起こし付き）の DB を save_minutes 経由（圧縮して保存）で作り、従来の fetch_all_minutes と
+サマリのページ取得（fetch_minutes_page + count_minutes）、開いた 1 件の本文取得を測る。
+
+    python benchmarks/bench_history.py --rows 1000 10000
+"""
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_common import build_db, timeit  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    ap.add_argument("--transcript-chars", type=int, default=20000)
+    ap.add_argument("--page-size", type=int, default=20)
+    args = ap.parse_args()
+
+    print(f"{'rows':>7} {'fetch_all ms':>13} {'page ms':>9} {'deep page ms':>13} {'open 1 ms':>10}")
+    for rows in args.rows:
+        db = build_db(Path(tempfile.mkdtemp(prefix="bench_history_")) / "minutes.sqlite3",
+                      rows, args.transcript_chars)
+        first = db.fetch_minutes_page(args.page_size)
+        deep_cursor = db.fetch_minutes_page(1, before=first[-1]["cursor"])[0]["cursor"]
+        for _ in range(rows // (2 * args.page_size)):
+            deep_cursor = db.fetch_minutes_page(args.page_size, before=deep_cursor)[-1]["cursor"]
+
+        t_all = timeit(db.fetch_all_minutes, repeat=3)
+        t_page = timeit(lambda: (db.fetch_minutes_page(args.page_size), db.count_minutes()))
+        t_deep = timeit(lambda: db.fetch_minutes_page(args.page_size, before=deep_cursor))
+        t_open = timeit(lambda: db.fetch_minutes(first[0]["id"]))
+        print(f"{rows:7d} {t_all:13.1f} {t_page:9.2f} {t_deep:13.2f} {t_open:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""bench_map_reduce.py – 長い会議の議事録生成を 1 回の呼び出しと map-reduce で比べる
+
+入力トークン数に比例して応答が遅くなり、コンテキスト長を超えると 400 を返す
+OpenAI 互換の偽サーバーに core_openai を向け、会議時間ごとに generate_minutes の所要時間を測る。
+single は MAP_REDUCE_TOKENS を無効にして文字起こし全文を 1 回で送る従来の動作。
+
+    python benchmarks/bench_map_reduce.py --hours 1 4 8
+"""
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from transcript_utils import estimate_tokens  # noqa: E402
+from bench_common import CHARS_PER_HOUR, isolate_data_dir, make_text  # noqa: E402
+
+
+
+class FakeLLM(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, sec_per_1k_tokens: float, base_latency: float, context_tokens: int):
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.sec_per_1k_tokens = sec_per_1k_tokens
+        self.base_latency = base_latency
+        self.context_tokens = context_tokens
+        self.calls = 0
+        self.lock = threading.Lock()
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        srv: FakeLLM = self.server
+        req = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        tokens = sum(estimate_tokens(m["content"]) for m in req["messages"])
+        with srv.lock:
+            srv.calls += 1
+        if tokens > srv.context_tokens:
+            status, body = 400, {"error": {"message": "context_length_exceeded", "code": "context_length_exceeded"}}
+        else:
+            time.sleep(srv.base_latency + tokens / 1000 * srv.sec_per_1k_tokens)
+            status, body = 200, {"id": "x", "created": 0, "model": req["model"], "object": "chat.completion",
+                                 "choices": [{"index": 0, "finish_reason": "stop",
+                                              "message": {"role": "assistant", "content": "- 要約"}}]}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_transcript(hours: float) -> str:
+    return make_text(random.Random(0), int(hours * CHARS_PER_HOUR))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--hours", type=float, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--sec-per-1k-tokens", type=float, default=0.05)
+    ap.add_argument("--base-latency", type=float, default=0.5)
+    ap.add_argument("--context-tokens", type=int, default=128_000)
+    args = ap.parse_args()
+    isolate_data_dir("bench_map_reduce_")
+
+    srv = FakeLLM(args.sec_per_1k_tokens, args.base_latency, args.context_tokens)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ["OPENAI_API_KEY"] = "x"
+
+    import core_openai  # noqa: E402
+    import resilience   # noqa: E402
+    resilience.configure("openai", core_openai.GPT_MODEL)  # レート制限なし（待ち時間を測定に含めない）
+    threshold = core_openai.MAP_REDUCE_TOKENS
+    core_openai.generate_minutes("warm up", "template", use_cache=False)  # 接続確立を測定から外す
+
+    print(f"{'hours':>5} {'tokens':>8} {'single s':>9} {'map-reduce s':>13} {'calls':>6}")
+    for hours in args.hours:
+        transcript = make_transcript(hours)
+        row = [f"{hours:5g}", f"{estimate_tokens(transcript):8d}"]
+        for limit in (float("inf"), threshold):
+            core_openai.MAP_REDUCE_TOKENS = limit
+            srv.calls = 0
+            t0 = time.perf_counter()
+            try:
+                core_openai.generate_minutes(transcript, "template", use_cache=False)
+                cell = f"{time.perf_counter() - t0:.1f}"
+            except Exception as e:  # noqa: BLE001
+                cell = f"error {getattr(e, 'status_code', '')}"
+            row.append(f"{cell:>9}" if limit == float("inf") else f"{cell:>13}")
+        row.append(f"{srv.calls:6d}")
+        print(" ".join(row))
+    core_openai.MAP_REDUCE_TOKENS = threshold
+
+
+if __name__ == "__main__":
+    main()
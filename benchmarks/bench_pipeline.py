@@ -0,0 +1,82 @@
+"""bench_pipeline.py – プロバイダごとのパイプライン並列化の効果を測る
+
+スタブのバックエンド（遅延のみ注入）で、従来の逐次実行と run_pipelines を比較する。
+
+    python benchmarks/bench_pipeline.py --chunks 6 --transcribe 0.3 --generate 0.5
+"""
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pipeline import Provider, run_pipelines  # noqa: E402
+
+
+def stub_provider(name: str, transcribe_s: float, generate_s: float, scale: float) -> Provider:
+    def _transcribe(path: Path) -> str:
+        time.sleep(transcribe_s * scale)
+        return f"{name}:{path.stem} "
+
+    def _minutes(transcript: str) -> str:
+        time.sleep(generate_s * scale)
+        return f"minutes({len(transcript)})"
+
+    def _agenda(transcript: str) -> str:
+        time.sleep(generate_s * scale)
+        return f"agenda({len(transcript)})"
+
+    return Provider(name, _transcribe, _minutes, _agenda, max_concurrency=8)
+
+
+def make_chunks(n: int) -> list:
+    tmp_dir = Path(tempfile.mkdtemp(prefix="bench_chunks_"))
+    paths = []
+    for i in range(n):
+        p = tmp_dir / f"chunk_{i:03d}.mp3"
+        p.write_bytes(b"\0")
+        paths.append(p)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=6)
+    ap.add_argument("--transcribe", type=float, default=0.3, help="チャンクあたりの文字起こし遅延（秒）")
+    ap.add_argument("--generate", type=float, default=0.5, help="生成 1 回あたりの遅延（秒）")
+    args = ap.parse_args()
+
+    # Gemini 側を少し遅くして、完了順に結果が返ることも確認する
+    providers = [
+        stub_provider("OpenAI", args.transcribe, args.generate, 1.0),
+        stub_provider("Gemini", args.transcribe, args.generate, 1.5),
+    ]
+
+    chunks = make_chunks(args.chunks)
+    t0 = time.perf_counter()
+    for p in providers:
+        transcript = "".join(p.transcribe(c).strip() for c in chunks)
+        p.generate_minutes(transcript)
+        p.generate_next_agenda(transcript)
+    t_seq = time.perf_counter() - t0
+
+    chunks = make_chunks(args.chunks)
+    t0 = time.perf_counter()
+    order = []
+    for result in run_pipelines(chunks, providers):
+        assert result.error is None, result.error
+        order.append(f"{result.name}@{result.elapsed:.2f}s")
+    t_par = time.perf_counter() - t0
+
+    slowest = max(args.transcribe, args.transcribe * 1.5) + args.generate * 1.5
+    print(f"chunks={args.chunks}")
+    print(f"  slowest single chain : {slowest:.2f}s")
+    print(f"  sequential           : {t_seq:.2f}s")
+    print(f"  pipelines            : {t_par:.2f}s  (x{t_seq / t_par:.1f})")
+    print(f"  completion order     : {', '.join(order)}")
+
+
+if __name__ == "__main__":
+    main()
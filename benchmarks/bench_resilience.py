@@ -0,0 +1,161 @@
+"""bench_resilience.py – 429 / 5xx を返すローカルの偽 API サーバーでリトライ層を試す
+
+偽サーバーは OpenAI 互換の /v1/chat/completions を持ち、
+- 直近 --window 秒のリクエスト数が --quota-rpm 相当を超えると 429（retry-after-ms 付き）
+- --error-rate の確率で 500 / 503
+- stream=true なら SSE で数トークンずつ返す（--stream-error-rate の確率で最初のトークン前に 503）
+を返す。実際の openai SDK と core_openai を OPENAI_BASE_URL で向け、
+素の呼び出し（bare）と resilience.Guard 経由（guarded）の成功数・所要時間・実効 RPM を比べる。
+
+    python benchmarks/bench_resilience.py --requests 600 --quota-rpm 3000
+"""
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_common import isolate_data_dir  # noqa: E402
+
+
+class FakeAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, quota_rpm: int, window: float, error_rate: float, stream_error_rate: float,
+                 latency: float):
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.window_sec = window
+        self.quota = max(1, int(quota_rpm * window / 60))
+        self.error_rate = error_rate
+        self.stream_error_rate = stream_error_rate
+        self.latency = latency
+        self.window = collections.deque()
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+        self.counts = collections.Counter()
+
+    def admit(self) -> float:
+        """受け付けるなら 0、レート超過なら次に空くまでの秒数を返す"""
+        now = time.monotonic()
+        with self.lock:
+            while self.window and now - self.window[0] >= self.window_sec:
+                self.window.popleft()
+            if len(self.window) >= self.quota:
+                return self.window_sec - (now - self.window[0])
+            self.window.append(now)
+            return 0.0
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        srv: FakeAPI = self.server
+        req = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        wait = srv.admit()
+        if wait:
+            srv.counts["429"] += 1
+            return self._json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                              {"retry-after-ms": str(int(wait * 1000))})
+        with srv.lock:
+            roll = srv.rng.random()
+        time.sleep(srv.latency)
+        error_rate = srv.stream_error_rate if req.get("stream") else srv.error_rate
+        if roll < error_rate:
+            srv.counts["5xx"] += 1
+            return self._json(503 if roll < error_rate / 2 else 500, {"error": {"message": "unavailable"}})
+        srv.counts["200"] += 1
+        base = {"id": "x", "created": 0, "model": req["model"]}
+        if not req.get("stream"):
+            return self._json(200, dict(base, object="chat.completion", choices=[
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "議事録"}}]))
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.end_headers()
+        for token in ["議", "事", "録"]:
+            chunk = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def run(label: str, fn, n: int, workers: int, srv: FakeAPI):
+    srv.window.clear()
+    srv.counts.clear()
+    ok = failed = 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(workers) as ex:
+        for fut in [ex.submit(fn, i) for i in range(n)]:
+            try:
+                fut.result()
+                ok += 1
+            except Exception:  # noqa: BLE001
+                failed += 1
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<16} {ok:5d} {failed:7d} {elapsed:8.1f} {ok / elapsed * 60:8.0f} "
+          f"{srv.counts['429']:6d} {srv.counts['5xx']:6d}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=600)
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--quota-rpm", type=int, default=3000)
+    ap.add_argument("--window", type=float, default=10.0, help="偽サーバーがレートを数える窓（秒）")
+    ap.add_argument("--error-rate", type=float, default=0.05)
+    ap.add_argument("--stream-error-rate", type=float, default=0.1)
+    ap.add_argument("--latency", type=float, default=0.05)
+    args = ap.parse_args()
+    isolate_data_dir("bench_resilience_")
+
+    srv = FakeAPI(args.quota_rpm, args.window, args.error_rate, args.stream_error_rate, args.latency)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ["OPENAI_API_KEY"] = "x"
+
+    import core_openai  # noqa: E402
+    import resilience   # noqa: E402
+    # 偽サーバーのクォータより少し低く設定する（実運用では RATE_LIMITS をアカウントの上限に合わせる）
+    guard = resilience.configure("openai", core_openai.GPT_MODEL, rpm=args.quota_rpm * 0.95,
+                                 policy=resilience.RetryPolicy(base_delay=0.2, max_delay=5))
+
+    def bare(i):
+        core_openai.get_client().chat.completions.create(
+            model=core_openai.GPT_MODEL, messages=[{"role": "user", "content": str(i)}])
+
+    def guarded(i):
+        core_openai.generate_minutes(f"会議 {i}", "template", use_cache=False)
+
+    def guarded_stream(i):
+        return "".join(core_openai.generate_minutes_stream(f"会議 {i}", "template", use_cache=False))
+
+    print(f"quota {args.quota_rpm} rpm, {args.requests} requests x {args.workers} threads, "
+          f"5xx rate {args.error_rate:.0%} (stream {args.stream_error_rate:.0%})")
+    print(f"{'mode':<16} {'ok':>5} {'failed':>7} {'sec':>8} {'ok/min':>8} {'429':>6} {'5xx':>6}")
+    run("bare", bare, args.requests, args.workers, srv)
+    run("guarded", guarded, args.requests, args.workers, srv)
+    run("guarded stream", guarded_stream, args.requests, args.workers, srv)
+    print(f"guard: retries={guard.retries} throttled={guard.throttled} breaker={guard.breaker.state}")
+
+
+if __name__ == "__main__":
+    main()
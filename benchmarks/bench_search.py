@@ -0,0 +1,45 @@
+"""bench_search.py – FTS5 全文検索と Python での線形走査を比べる
+
+合成データの DB（数万件）を save_minutes 経由で作り、search_minutes と
+fetch_all_minutes した結果を Python で部分一致検索する場合の時間を測る。
+3 文字以上の語は trigram、2 文字の語（「予算」「田中」など）は minutes_bigram の索引で引く。
+
+    python benchmarks/bench_search.py --rows 20000
+"""
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_common import build_db, timeit  # noqa: E402
+
+QUERIES = ["予算確認", "採用計画 顧客", "品質課題の共有", "存在しない語句", "予算", "顧客 契約", "田中"]
+
+
+def linear_scan(db, query: str) -> list:
+    terms = query.split()
+    return [r for r in db.fetch_all_minutes()
+            if all(t in r["transcript"] or t in r["minutes_md"] or t in r["title"] for t in terms)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--chars", type=int, default=2000)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    db = build_db(Path(tempfile.mkdtemp(prefix="bench_search_")) / "minutes.sqlite3", args.rows, args.chars)
+    print(f"built {args.rows} rows in {time.perf_counter() - t0:.1f}s (fts5={db.fts_enabled})")
+    print(f"{'query':<16} {'fts ms':>8} {'scan ms':>9}")
+    for q in QUERIES:
+        t_fts = timeit(lambda: db.search_minutes(q), repeat=3)
+        t_scan = timeit(lambda: linear_scan(db, q), repeat=1)
+        print(f"{q:<16} {t_fts:8.1f} {t_scan:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""bench_startup.py – コアモジュールの import 時間とリラン時の初期化コストを測る
+
+- import: 新しいインタプリタで core_openai / core_gemini を import する時間
+  （比較用に、従来どおり SDK と streamlit を import してクライアントを作った場合も測る）
+- rerun : Streamlit のリランごとに MinutesDB を作り直す場合と、1 つを使い回す場合の差
+
+    python benchmarks/bench_startup.py --repeat 5
+"""
+from pathlib import Path
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from db import MinutesDB  # noqa: E402
+
+LAZY = "import core_openai, core_gemini"
+# 変更前の core モジュールが import 時に行っていた処理
+EAGER = (
+    "import openai, streamlit; from google import genai; "
+    "openai.api_key = 'x'; genai.Client(api_key='x')"
+)
+
+
+def time_import(code: str, repeat: int) -> float:
+    env = dict(os.environ, OPENAI_API_KEY="x", GEMINI_API_KEY="x")
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def time_reruns(reruns: int) -> tuple:
+    db_path = Path(tempfile.mkdtemp(prefix="bench_startup_")) / "minutes.sqlite3"
+    MinutesDB(db_path)
+
+    t0 = time.perf_counter()
+    for _ in range(reruns):
+        MinutesDB(db_path).fetch_latest_minutes()
+    fresh = (time.perf_counter() - t0) / reruns
+
+    shared = MinutesDB(db_path)
+    t0 = time.perf_counter()
+    for _ in range(reruns):
+        shared.fetch_latest_minutes()
+    cached = (time.perf_counter() - t0) / reruns
+    return fresh, cached
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--reruns", type=int, default=200)
+    args = ap.parse_args()
+
+    baseline = time_import("pass", args.repeat)
+    lazy = time_import(LAZY, args.repeat) - baseline
+    eager = time_import(EAGER, args.repeat) - baseline
+    print(f"import (interpreter start excluded, median of {args.repeat})")
+    print(f"  eager SDK + client : {eager * 1000:8.1f} ms")
+    print(f"  lazy core modules  : {lazy * 1000:8.1f} ms")
+
+    fresh, cached = time_reruns(args.reruns)
+    print(f"per-rerun DB setup (mean of {args.reruns})")
+    print(f"  new MinutesDB      : {fresh * 1000:8.3f} ms")
+    print(f"  cached MinutesDB   : {cached * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""bench_storage.py – 議事録 DB の圧縮前後でファイルサイズと読み出し時間を比べる
+
+合成した日本語の文字起こし・議事録を、圧縮前の形式（本文を TEXT で保持し、FTS も本文のコピーを持つ）で
+書き込んでサイズと読み出し時間を測り、MinutesDB で開いて移行した後に同じ操作を測り直す。
+- list   : 履歴 1 ページ分（20 件）のサマリ取得
+- open   : 1 件の本文取得（圧縮後は展開を含む）
+- search : 全文検索（3 文字以上の語、上位 20 件とスニペット）
+- scan   : 全件を本文込みで読む
+
+    python benchmarks/bench_storage.py --meetings 200 --hours 1
+"""
+from pathlib import Path
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import db as db_module  # noqa: E402
+from db import MinutesDB  # noqa: E402
+from bench_common import CHARS_PER_HOUR, PROVIDERS, make_minutes, make_text, timeit  # noqa: E402
+
+def write_legacy(path: Path, meetings: int, hours: float):
+    """圧縮前の形式（PRAGMA user_version = 0）の DB を作る"""
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE minutes (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, transcript TEXT,
+                    minutes_md TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+    conn.execute("CREATE INDEX idx_minutes_created_at ON minutes(created_at DESC, id DESC)")
+    conn.execute("CREATE VIRTUAL TABLE minutes_fts USING fts5(title, transcript, minutes_md, tokenize='trigram')")
+    for n in range(meetings):
+        base = make_text(rng, int(hours * CHARS_PER_HOUR))
+        for provider in PROVIDERS:  # 1 会議につきプロバイダごとに保存される
+            title, minutes_md = f"{provider} 会議 {n}", make_minutes(rng)
+            cur = conn.execute("INSERT INTO minutes (title, transcript, minutes_md) VALUES (?,?,?)",
+                               (title, base, minutes_md))
+            conn.execute("INSERT INTO minutes_fts (rowid, title, transcript, minutes_md) VALUES (?,?,?,?)",
+                         (cur.lastrowid, title, base, minutes_md))
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def measure_legacy(path: Path, ids: list, repeat: int) -> dict:
+    conn = sqlite3.connect(path)
+    it = iter(ids * repeat)
+    return dict(
+        list=timeit(lambda: conn.execute(
+            "SELECT id, title, created_at, LENGTH(transcript), LENGTH(minutes_md) FROM minutes "
+            "ORDER BY created_at DESC, id DESC LIMIT 20").fetchall(), repeat),
+        open=timeit(lambda: conn.execute(
+            "SELECT id, title, transcript, minutes_md, created_at FROM minutes WHERE id=?", (next(it),)).fetchone(),
+            repeat),
+        search=timeit(lambda: conn.execute(
+            """SELECT m.id, m.title, m.created_at, snippet(minutes_fts, -1, '**', '**', '…', 24)
+               FROM minutes_fts JOIN minutes AS m ON m.id = minutes_fts.rowid
+               WHERE minutes_fts MATCH '"スケジュール"' ORDER BY rank LIMIT 20""").fetchall(), repeat),
+        scan=timeit(lambda: conn.execute(
+            "SELECT id, title, transcript, minutes_md, created_at FROM minutes").fetchall(), max(1, repeat // 10)),
+    )
+
+
+def measure(db: MinutesDB, ids: list, repeat: int) -> dict:
+    it = iter(ids * repeat)
+    return dict(
+        list=timeit(lambda: db.fetch_minutes_page(20), repeat),
+        open=timeit(lambda: db.fetch_minutes(next(it)), repeat),
+        search=timeit(lambda: db.search_minutes("スケジュール", limit=20), repeat),
+        scan=timeit(db.fetch_all_minutes, max(1, repeat // 10)),
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--meetings", type=int, default=200)
+    ap.add_argument("--hours", type=float, default=1.0)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    path = Path(tempfile.mkdtemp(prefix="bench_storage_")) / "minutes.sqlite3"
+    write_legacy(path, args.meetings, args.hours)
+    ids = list(range(1, args.meetings * len(PROVIDERS) + 1))
+    random.Random(1).shuffle(ids)
+    before_size = os.path.getsize(path)
+    before = measure_legacy(path, ids, args.repeat)
+
+    t0 = time.perf_counter()
+    db = MinutesDB(path)
+    migrate_sec = time.perf_counter() - t0
+    after_size = os.path.getsize(path)
+    after = measure(db, ids, args.repeat)
+
+    codec = "zstd" if db_module.zstandard is not None else "zlib"
+    print(f"{args.meetings} meetings x {len(PROVIDERS)} providers, {args.hours:g} h transcripts, codec {codec}, "
+          f"migration {migrate_sec:.1f} s")
+    print(f"{'':>10} {'before':>10} {'after':>10}")
+    print(f"{'size MB':>10} {before_size / 1e6:10.1f} {after_size / 1e6:10.1f}")
+    for key in ("list", "open", "search", "scan"):
+        print(f"{key + ' ms':>10} {before[key]:10.2f} {after[key]:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
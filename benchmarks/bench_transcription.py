@@ -0,0 +1,76 @@
+"""bench_transcription.py – 逐次実行と並列スケジューラの所要時間を比較する
+
+遅延を注入したダミーのプロバイダ関数を使うため、API キーやネットワークは不要。
+
+    python benchmarks/bench_transcription.py --chunks 6 --latency 0.5
+"""
+from pathlib import Path
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pipeline import transcribe_chunks  # noqa: E402
+
+
+def fake_provider(name: str, latencies: dict):
+    def _transcribe(path: Path) -> str:
+        time.sleep(latencies[path])
+        return f"[{name}:{path.stem}]"
+    return _transcribe
+
+
+def make_chunks(n: int) -> list:
+    tmp_dir = Path(tempfile.mkdtemp(prefix="bench_chunks_"))
+    paths = []
+    for i in range(n):
+        p = tmp_dir / f"chunk_{i:03d}.mp3"
+        p.write_bytes(b"\0" * 1024)
+        paths.append(p)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=6)
+    ap.add_argument("--latency", type=float, default=0.5, help="チャンクあたりの平均遅延（秒）")
+    ap.add_argument("--jitter", type=float, default=0.5, help="遅延のばらつき（平均に対する割合）")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    chunks = make_chunks(args.chunks)
+    latencies = {
+        p: args.latency * (1 + rng.uniform(-args.jitter, args.jitter)) for p in chunks
+    }
+    providers = {name: fake_provider(name, latencies) for name in ("openai", "gemini")}
+
+    # 逐次（従来の app.py と同じ順序）
+    t0 = time.perf_counter()
+    seq = {name: [] for name in providers}
+    for p in chunks:
+        for name, fn in providers.items():
+            seq[name].append(fn(p))
+    t_seq = time.perf_counter() - t0
+
+    # 並列
+    t0 = time.perf_counter()
+    par = transcribe_chunks(chunks, providers, max_workers=args.workers)
+    t_par = time.perf_counter() - t0
+
+    assert par == seq, "チャンク順が崩れています"
+    assert not any(p.exists() for p in chunks), "チャンクファイルが削除されていません"
+
+    print(f"chunks={args.chunks} workers/provider={args.workers}")
+    print(f"  sum of latencies   : {2 * sum(latencies.values()):.2f}s")
+    print(f"  longest chunk      : {max(latencies.values()):.2f}s")
+    print(f"  sequential         : {t_seq:.2f}s")
+    print(f"  concurrent         : {t_par:.2f}s  (x{t_seq / t_par:.1f})")
+
+
+if __name__ == "__main__":
+    main()
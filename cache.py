@@ -0,0 +1,277 @@
+"""cache.py – 文字起こし結果・生成結果の永続キャッシュ（SQLite）
+
+- 文字起こし: チャンク音声の SHA-256 + モデル名 + 言語 をキーに保存
+- 議事録 / アジェンダ: temperature=0 の生成結果を
+  (プロバイダ, モデル, プロンプト, 文字起こし, 前回議事録) のハッシュをキーに保存
+同じ入力を再処理したときは API を呼ばずに結果を返す。
+保存先は data/cache.sqlite3（環境変数 CACHE_DB_PATH で変更可）。
+"""
+from pathlib import Path
+from concurrent.futures import Future
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Sequence
+
+DATA_DIR = Path(__file__).parent / "data"
+DEFAULT_CACHE_PATH = DATA_DIR / "cache.sqlite3"
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# ─────────────────────────────────────────
+# 文字起こしキャッシュ
+#   サイズ上限を超えたら最終利用時刻の古い順（LRU）に削除
+# ─────────────────────────────────────────
+class TranscriptCache:
+    def __init__(self, db_path: Path = DEFAULT_CACHE_PATH, *, max_bytes: int = 256 * 1024 * 1024):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS transcripts
+            (key TEXT PRIMARY KEY,
+             model TEXT,
+             lang TEXT,
+             text TEXT,
+             size INTEGER,
+             created_at REAL,
+             last_used REAL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_last_used ON transcripts(last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(audio_sha256: str, model: str, lang: str) -> str:
+        return hashlib.sha256(f"{audio_sha256}\0{model}\0{lang}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT text FROM transcripts WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE transcripts SET last_used=? WHERE key=?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def contains(self, key: str) -> bool:
+        """ヒット数・最終利用時刻を変えずに存在だけ確認する"""
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM transcripts WHERE key=?", (key,)).fetchone() is not None
+
+    def put(self, key: str, model: str, lang: str, text: str):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO transcripts (key, model, lang, text, size, created_at, last_used) "
+                "VALUES (?,?,?,?,?,?,?)",
+                (key, model, lang, text, len(text.encode()), now, now))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM transcripts ORDER BY last_used").fetchall()
+        victims = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM transcripts WHERE key=?", victims)
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM transcripts")
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+        return dict(hits=self.hits, misses=self.misses, entries=entries, bytes=size)
+
+
+# ─────────────────────────────────────────
+# 生成キャッシュ（議事録 / アジェンダ）
+#   TTL を過ぎたエントリは無効、件数上限を超えたら LRU で削除
+# ─────────────────────────────────────────
+class GenerationCache:
+    def __init__(self, db_path: Path = DEFAULT_CACHE_PATH, *,
+                 ttl_sec: float = 7 * 24 * 3600, max_entries: int = 1000):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS generations
+            (key TEXT PRIMARY KEY,
+             provider TEXT,
+             model TEXT,
+             text TEXT,
+             created_at REAL,
+             last_used REAL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_last_used ON generations(last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(provider: str, model: str, parts: Sequence[Optional[str]]) -> str:
+        h = hashlib.sha256(f"{provider}\0{model}".encode())
+        for part in parts:
+            # None と空文字を区別するため長さ付きで連結する
+            data = b"" if part is None else part.encode()
+            h.update(b"\1" if part is None else b"\0")
+            h.update(len(data).to_bytes(8, "big") + data)
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT text, created_at FROM generations WHERE key=?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_sec:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE generations SET last_used=? WHERE key=?", (now, key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, provider: str, model: str, text: str):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO generations (key, provider, model, text, created_at, last_used) "
+                "VALUES (?,?,?,?,?,?)",
+                (key, provider, model, text, now, now))
+            self.conn.execute("DELETE FROM generations WHERE created_at < ?", (now - self.ttl_sec,))
+            self.conn.execute(
+                "DELETE FROM generations WHERE key NOT IN "
+                "(SELECT key FROM generations ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,))
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM generations")
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+        return dict(hits=self.hits, misses=self.misses, entries=entries)
+
+
+_transcript_cache: Optional[TranscriptCache] = None
+_generation_cache: Optional[GenerationCache] = None
+_init_lock = threading.Lock()
+
+
+def _cache_path() -> Path:
+    return Path(os.getenv("CACHE_DB_PATH") or DEFAULT_CACHE_PATH)
+
+
+def get_transcript_cache() -> TranscriptCache:
+    """プロセス内で共有する TranscriptCache を返す（初回呼び出し時に生成）"""
+    global _transcript_cache
+    with _init_lock:
+        if _transcript_cache is None:
+            _transcript_cache = TranscriptCache(_cache_path())
+        return _transcript_cache
+
+
+def get_generation_cache() -> GenerationCache:
+    """プロセス内で共有する GenerationCache を返す（初回呼び出し時に生成）"""
+    global _generation_cache
+    with _init_lock:
+        if _generation_cache is None:
+            _generation_cache = GenerationCache(_cache_path())
+        return _generation_cache
+
+
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def cached_generation(provider: str, model: str, parts: Sequence[Optional[str]],
+                      compute: Callable[[], str], *, use_cache: bool = True) -> str:
+    """parts（プロンプト・文字起こし・前回議事録など）が同一なら前回の生成結果を返す。
+       use_cache=False のときはキャッシュを読まずに再生成し、結果で上書きする。
+       同じキーの生成が別スレッドで実行中なら、API を重ねて呼ばずにその結果を待つ
+       （議事録とアジェンダが同じ部分要約を同時に必要とする場合など）。
+    """
+    cache = get_generation_cache()
+    key = cache.make_key(provider, model, parts)
+    if use_cache:
+        text = cache.get(key)
+        if text is not None:
+            return text
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = _inflight[key] = Future()
+    if not owner:
+        return fut.result()
+    try:
+        text = compute()
+        cache.put(key, provider, model, text)
+        fut.set_result(text)
+        return text
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def cached_generation_stream(provider: str, model: str, parts: Sequence[Optional[str]],
+                             stream: Callable[[], Iterator[str]], *, use_cache: bool = True) -> Iterator[str]:
+    """cached_generation のストリーミング版。
+       キャッシュにあれば全文を 1 回で yield し、なければ stream() の出力を流しつつ最後に保存する。
+    """
+    cache = get_generation_cache()
+    key = cache.make_key(provider, model, parts)
+    if use_cache:
+        text = cache.get(key)
+        if text is not None:
+            yield text
+            return
+    pieces = []
+    for piece in stream():
+        pieces.append(piece)
+        yield piece
+    cache.put(key, provider, model, "".join(pieces).strip())
+
+
+def cached_transcription(model: str) -> Callable:
+    """transcribe_audio(audio_path, *, lang=...) をキャッシュ付きにするデコレータ"""
+    def decorator(fn: Callable[..., str]) -> Callable[..., str]:
+        @functools.wraps(fn)
+        def wrapper(audio_path: Path, *, lang: str = "ja") -> str:
+            cache = get_transcript_cache()
+            key = cache.make_key(file_sha256(audio_path), model, lang)
+            text = cache.get(key)
+            if text is None:
+                text = fn(audio_path, lang=lang)
+                cache.put(key, model, lang, text)
+            return text
+        return wrapper
+    return decorator
@@ -0,0 +1,204 @@
+"""cli.py – 録音ファイルをまとめて処理するコマンドライン版（Streamlit なし）
+
+ディレクトリ・glob・ファイルを受け取り、app.py と同じ audio_utils / バックエンド / MinutesDB で
+文字起こし → 議事録・アジェンダ生成 → 保存を行う。
+- ffmpeg（変換・分割、CPU）と API 呼び出し（I/O）は別々の同時実行数で動かす
+- 元音声の SHA-256 が同じ議事録を保存済みのプロバイダは飛ばす（再実行しても二重に処理しない）
+- 最後にスループット（ファイル/時、音声分/実時間分）と段階ごとの内訳を表示する
+
+    python cli.py recordings/ "archive/**/*.m4a" --backends OpenAI Gemini --ffmpeg-workers 2 --api-workers 4
+"""
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+import argparse
+import glob
+import logging
+import os
+import sys
+import threading
+import time
+from typing import List, Optional
+
+import metrics
+from audio_utils import AUDIO_PROFILES, DEFAULT_PROFILE, probe_duration
+from backends import available_backends, build_providers, chunk_length_for_backends, enabled_backends
+from cache import file_sha256
+from db import MinutesDB
+from pipeline import merge_for, split_for_providers, stream_pipelines
+
+DEFAULT_DB_PATH = Path(__file__).parent / "data" / "minutes.sqlite3"
+AUDIO_SUFFIXES = {".mp3", ".m4a", ".wav", ".aac", ".flac", ".ogg", ".webm", ".mp4"}
+
+
+@dataclass
+class FileResult:
+    path: Path
+    status: str  # "done" / "skipped" / "failed"
+    audio_sec: float = 0.0
+    elapsed: float = 0.0
+    detail: str = ""
+
+
+def collect_inputs(patterns: List[str]) -> List[Path]:
+    """ディレクトリ（配下を再帰的に探索）・glob・ファイルパスから音声ファイルを重複なく集める"""
+    found: List[Path] = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            found += sorted(p for p in path.rglob("*") if p.suffix.lower() in AUDIO_SUFFIXES)
+        elif any(c in pattern for c in "*?["):
+            found += sorted(Path(p) for p in glob.glob(pattern, recursive=True)
+                            if Path(p).suffix.lower() in AUDIO_SUFFIXES)
+        elif path.is_file():
+            found.append(path)
+        else:
+            print(f"見つかりません: {pattern}", file=sys.stderr)
+    return list(dict.fromkeys(p.resolve() for p in found))
+
+
+class BatchRunner:
+    """1 ファイルを 1 スレッドで通しつつ、ffmpeg と API の段階ごとに同時実行数を制限する"""
+
+    def __init__(self, db: MinutesDB, backend_names: List[str], *, profile: str = DEFAULT_PROFILE,
+                 split_mode: str = "fixed", overlap_sec: float = 0.0, use_cache: bool = True,
+                 ffmpeg_workers: int = 2, api_workers: int = 4):
+        self.db = db
+        self.backend_names = backend_names
+        self.profile = profile
+        self.split_mode = split_mode
+        self.overlap_sec = overlap_sec
+        self.use_cache = use_cache
+        self.ffmpeg_workers = ffmpeg_workers
+        self.api_workers = api_workers
+        self._ffmpeg_slots = threading.BoundedSemaphore(ffmpeg_workers)
+        self._api_slots = threading.BoundedSemaphore(api_workers)
+        self._claimed = set()  # 同じ内容のファイルがバッチ内に複数あれば 1 つだけ処理する
+        self._lock = threading.Lock()
+        self.runs: List[metrics.Run] = []
+        self.chunk_length_sec = chunk_length_for_backends(backend_names, profile)
+
+    def run(self, paths: List[Path]) -> List[FileResult]:
+        # ffmpeg 待ち + API 待ちの合計までしか同時に抱えないので、一時ファイルが溜まりすぎない
+        with ThreadPoolExecutor(max_workers=self.ffmpeg_workers + self.api_workers,
+                                thread_name_prefix="batch") as ex:
+            futures = [ex.submit(self.process, p) for p in paths]
+            results = []
+            for fut in as_completed(futures):
+                res = fut.result()
+                results.append(res)
+                print(f"[{len(results)}/{len(paths)}] {res.status:7s} {res.path.name} "
+                      f"({res.audio_sec / 60:.1f} 分, {res.elapsed:.1f} 秒){' ' + res.detail if res.detail else ''}",
+                      flush=True)
+        return results
+
+    def process(self, path: Path) -> FileResult:
+        t0 = time.perf_counter()
+        with metrics.start_run(path.name) as run:
+            try:
+                result = self._process(path)
+            except Exception as e:  # noqa: BLE001 – 1 ファイルの失敗でバッチ全体を止めない
+                result = FileResult(path, "failed", detail=f"{type(e).__name__}: {e}")
+        with self._lock:
+            self.runs.append(run)
+        result.elapsed = time.perf_counter() - t0
+        return result
+
+    def _process(self, path: Path) -> FileResult:
+        # ── ffmpeg 段階: ハッシュ計算・処理済み判定・変換と分割 ──
+        with self._ffmpeg_slots:
+            sha = file_sha256(path)
+            with self._lock:
+                if sha in self._claimed:
+                    return FileResult(path, "skipped", detail="同じ内容のファイルをこのバッチで処理済み")
+                self._claimed.add(sha)
+            todo = [n for n in self.backend_names if n not in self.db.providers_for_source(sha)]
+            if not todo:
+                return FileResult(path, "skipped", detail="処理済み")
+            audio_sec = probe_duration(path)
+            providers = build_providers(todo, self.db, use_cache=self.use_cache)
+            chunks = list(split_for_providers(
+                path, providers,
+                split_mode=self.split_mode,
+                profile=self.profile,
+                chunk_length_sec=self.chunk_length_sec,
+                overlap_sec=self.overlap_sec,
+            ))
+
+        # ── API 段階: 文字起こし → 議事録・アジェンダ生成 → 保存 ──
+        with self._api_slots:
+            failed = []
+            for event in stream_pipelines(chunks, providers, merge=merge_for(self.overlap_sec)):
+                if event.kind != "done":
+                    continue
+                result = event.result
+                if result.error:
+                    failed.append(f"{result.name}: {result.error!r}")
+                    continue
+                self.db.save_minutes(f"{result.name} {path.name}", result.transcript, result.minutes,
+                                     provider=result.name, source_sha256=sha)
+        if failed:
+            return FileResult(path, "failed", audio_sec, detail=" / ".join(failed))
+        return FileResult(path, "done", audio_sec)
+
+
+def print_summary(results: List[FileResult], runs: List[metrics.Run], wall: float):
+    done = [r for r in results if r.status == "done"]
+    audio_min = sum(r.audio_sec for r in done) / 60
+    counts = {s: sum(r.status == s for r in results) for s in ("done", "skipped", "failed")}
+    print()
+    print(f"完了 {counts['done']} / スキップ {counts['skipped']} / 失敗 {counts['failed']}  "
+          f"実時間 {wall:.1f} 秒")
+    if wall > 0 and done:
+        print(f"スループット: {len(done) / (wall / 3600):.1f} ファイル/時, "
+              f"音声 {audio_min / (wall / 60):.2f} 分/実時間 1 分")
+    rows = metrics.Run(label="batch", spans=[s for run in runs for s in run.spans]).summary()
+    if rows:
+        print()
+        print(f"{'stage':<15} {'provider':<8} {'calls':>6} {'total s':>9} {'max s':>7} "
+              f"{'tokens in':>10} {'tokens out':>10} {'cost $':>8}")
+        for r in rows:
+            print(f"{r['stage']:<15} {r['provider'] or '-':<8} {r['calls']:6d} {r['total_sec']:9.1f} "
+                  f"{r['max_sec']:7.1f} {r['tokens_in']:10d} {r['tokens_out']:10d} {r['cost_usd']:8.4f}")
+        print(f"概算料金の合計: ${sum(r['cost_usd'] for r in rows):.4f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="録音ファイルをまとめて文字起こし・議事録化して DB に保存する")
+    ap.add_argument("inputs", nargs="+", help="ディレクトリ・glob（例: 'rec/**/*.m4a'）・ファイル")
+    ap.add_argument("--backends", nargs="+", choices=available_backends(), default=None,
+                    help="使うバックエンド（既定は ENABLED_BACKENDS）")
+    ap.add_argument("--db", type=Path, default=DEFAULT_DB_PATH)
+    ap.add_argument("--profile", choices=list(AUDIO_PROFILES), default=DEFAULT_PROFILE)
+    ap.add_argument("--split", choices=["fixed", "silence"], default="fixed")
+    ap.add_argument("--overlap-sec", type=float, default=0.0, help="--split silence のときのチャンクの重なり")
+    ap.add_argument("--ffmpeg-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help="同時に変換・分割するファイル数（CPU）")
+    ap.add_argument("--api-workers", type=int, default=4,
+                    help="同時に API へ送るファイル数（1 ファイル内のチャンクは各バックエンドの同時数で並列）")
+    ap.add_argument("--no-cache", action="store_true", help="生成キャッシュを使わずに再生成する")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("処理する音声ファイルがありません", file=sys.stderr)
+        return 1
+    args.db.parent.mkdir(parents=True, exist_ok=True)
+    runner = BatchRunner(
+        MinutesDB(args.db), args.backends or enabled_backends(),
+        profile=args.profile, split_mode=args.split, overlap_sec=args.overlap_sec,
+        use_cache=not args.no_cache, ffmpeg_workers=args.ffmpeg_workers, api_workers=args.api_workers,
+    )
+    print(f"{len(paths)} ファイル, バックエンド {', '.join(runner.backend_names)}, "
+          f"ffmpeg {runner.ffmpeg_workers} 並列 / API {runner.api_workers} 並列", flush=True)
+    t0 = time.perf_counter()
+    results = runner.run(paths)
+    print_summary(results, runner.runs, time.perf_counter() - t0)
+    return 1 if any(r.status == "failed" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
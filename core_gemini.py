@@ -1,68 +1,286 @@
 from pathlib import Path
 import os
 import datetime as dt
-from typing import Optional
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import streamlit as st
-from google import genai
+import metrics
+from cache import (DEFAULT_CACHE_PATH, cached_generation, cached_generation_stream, cached_transcription,
+                   file_sha256, get_transcript_cache)
+from resilience import get_guard, status_of
+from action_items import format_open_tasks
+from templates import AGENDA_INSTRUCTION, MAP_INSTRUCTION, MINUTES_INSTRUCTION, OPEN_TASKS_HEADER
+from transcript_utils import estimate_tokens, split_transcript
 #from jinja2 import Template
 
 # ─────────────────────────────────────────
 # Google Gemini API (Gen AI SDK) 設定
+#   google-genai / streamlit の import とクライアント生成は初回利用時まで遅らせる
 # ─────────────────────────────────────────
-API_KEY = os.getenv("GEMINI_API_KEY") or st.secrets.get("GEMINI_API_KEY")
-# ★ Client を直接初期化 ★
-client = genai.Client(api_key=API_KEY)  # :contentReference[oaicite:0]{index=0}
+def _api_key() -> Optional[str]:
+    key = os.getenv("GEMINI_API_KEY")
+    if key:
+        return key
+    import streamlit as st
+    return st.secrets.get("GEMINI_API_KEY")
+
+
+@lru_cache(maxsize=1)
+def get_client():
+    """プロセス内で共有する genai.Client（HTTP 接続は SDK 内でプールして再利用）"""
+    from google import genai
+    return genai.Client(api_key=_api_key())  # :contentReference[oaicite:0]{index=0}
+
+
+def _http_options(timeout_sec: float):
+    from google.genai import types
+    return types.HttpOptions(timeout=int(timeout_sec * 1000))  # ミリ秒指定
+
+
+def _config(timeout_sec: float):
+    from google.genai import types
+    return types.GenerateContentConfig(
+        temperature=0,  # 再現性のため温度を0に設定
+        http_options=_http_options(timeout_sec),
+    )
 
 # モデル設定
 TRANSCRIBE_MODEL = "gemini-2.5-flash-preview-05-20"
 GENERATION_MODEL = "gemini-2.5-flash-preview-05-20"
+MAX_CONCURRENCY = 4  # 文字起こしの同時リクエスト数
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024 * 1024  # Files API のファイルサイズ上限
+MAX_AUDIO_SECONDS = None                   # 音声長は実質無制限（9.5 時間）
+UPLOAD_TIMEOUT     = 300  # 1 リクエストのタイムアウト（秒）
+TRANSCRIBE_TIMEOUT = 300
+GENERATION_TIMEOUT = 120
+OUTPUT_TOKENS      = 2000  # tokens/min の見積もりに加える出力トークン数
+MAP_REDUCE_TOKENS  = 100_000  # 文字起こしがこれを超えたら部分ごとに要約してからまとめる
+MAP_CHUNK_TOKENS   = 30_000   # 部分要約 1 回あたりの入力トークン数
+UPLOAD_CONCURRENCY = 8     # Files API への同時アップロード数（文字起こしの同時数とは別）
+UPLOAD_TTL_SEC     = 48 * 3600  # expiration_time が返らなかったときの有効期間（Files API は 48 時間）
+UPLOAD_REUSE_MARGIN_SEC = 3600  # 期限まで 1 時間を切ったファイルは再利用しない
+
+# モデルごとのレート上限 (requests/min, tokens/min)。アカウントの Tier に合わせて調整する
+RATE_LIMITS = {
+    GENERATION_MODEL: (1000, 1_000_000),
+}
+
+
+def _guard(model: str):
+    rpm, tpm = RATE_LIMITS.get(model, (None, None))
+    return get_guard("gemini", model, rpm=rpm, tpm=tpm)
+
+
+def _tokens(contents: list) -> int:
+    return sum(estimate_tokens(c) for c in contents if isinstance(c, str)) + OUTPUT_TOKENS
+
+
+# ─────────────────────────────────────────
+# 0) Files API のアップロード管理
+#    内容ハッシュごとにアップロード済みファイルと有効期限を SQLite に記録し、
+#    期限内なら再利用する（文字起こしに失敗して再実行したときなど）。
+#    文字起こしが済んだファイルはすぐに削除する。
+# ─────────────────────────────────────────
+class UploadManager:
+    def __init__(self, db_path: Path = DEFAULT_CACHE_PATH, *, max_workers: int = UPLOAD_CONCURRENCY):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.uploads = 0
+        self.reuses = 0
+        self.deletes = 0
+        self._lock = threading.RLock()
+        self._inflight: Dict[str, Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-upload")
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS gemini_files
+            (sha256 TEXT PRIMARY KEY,
+             name TEXT,
+             uri TEXT,
+             mime_type TEXT,
+             expires_at REAL,
+             created_at REAL)""")
+        # 期限切れのファイルはサーバー側で消えているので記録だけ削除する
+        self.conn.execute("DELETE FROM gemini_files WHERE expires_at < ?", (time.time(),))
+        self.conn.commit()
+
+    def _lookup(self, sha: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT uri, mime_type FROM gemini_files WHERE sha256=? AND expires_at > ?",
+                (sha, time.time() + UPLOAD_REUSE_MARGIN_SEC)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _upload(self, sha: str, path: Path) -> Tuple[str, str]:
+        from google.genai import types
+        with metrics.span("upload", provider="gemini", bytes_in=Path(path).stat().st_size):
+            myfile = _guard("files").call(lambda: get_client().files.upload(
+                file=str(path),
+                # mime_type は省略可。SDK が自動判別します。
+                config=types.UploadFileConfig(http_options=_http_options(UPLOAD_TIMEOUT)),
+            ))  # :contentReference[oaicite:1]{index=1}
+        expires = myfile.expiration_time.timestamp() if myfile.expiration_time else time.time() + UPLOAD_TTL_SEC
+        with self._lock:
+            self.uploads += 1
+            self.conn.execute(
+                "INSERT OR REPLACE INTO gemini_files (sha256, name, uri, mime_type, expires_at, created_at) "
+                "VALUES (?,?,?,?,?,?)",
+                (sha, myfile.name, myfile.uri, myfile.mime_type, expires, time.time()))
+            self.conn.commit()
+        return myfile.uri, myfile.mime_type
+
+    def prefetch(self, path: Path, sha: Optional[str] = None) -> Future:
+        """path のアップロードを開始し（記録があれば再利用し）、(uri, mime_type) の Future を返す"""
+        sha = sha or file_sha256(path)
+        with self._lock:
+            fut = self._inflight.get(sha)
+            if fut is not None:
+                return fut
+            found = self._lookup(sha)
+            if found:
+                fut = Future()
+                fut.reused = True
+                fut.set_result(found)
+                return fut
+            fut = self._inflight[sha] = self._executor.submit(metrics.bind(self._upload), sha, path)
+        fut.add_done_callback(lambda _f: self._done(sha))
+        return fut
+
+    def _done(self, sha: str):
+        with self._lock:
+            self._inflight.pop(sha, None)
+
+    def get(self, path: Path) -> Tuple[str, object]:
+        """(内容ハッシュ, generate_content に渡す Part) を返す"""
+        from google.genai import types
+        sha = file_sha256(path)
+        fut = self.prefetch(path, sha)
+        uri, mime_type = fut.result()
+        if getattr(fut, "reused", False):
+            with self._lock:
+                self.reuses += 1
+        return sha, types.Part.from_uri(file_uri=uri, mime_type=mime_type)
+
+    def forget(self, sha: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM gemini_files WHERE sha256=?", (sha,))
+            self.conn.commit()
+
+    def release(self, sha: str):
+        """リモートのファイルを削除して記録を消す（失敗しても期限切れで消えるので握りつぶす）"""
+        with self._lock:
+            row = self.conn.execute("SELECT name FROM gemini_files WHERE sha256=?", (sha,)).fetchone()
+        if row is None:
+            return
+        self.forget(sha)
+        try:
+            get_client().files.delete(name=row[0])
+            with self._lock:
+                self.deletes += 1
+        except Exception:  # noqa: BLE001
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM gemini_files").fetchone()[0]
+        return dict(uploads=self.uploads, reuses=self.reuses, deletes=self.deletes, entries=entries)
+
+
+@lru_cache(maxsize=1)
+def get_upload_manager() -> UploadManager:
+    return UploadManager()
+
+
+def prefetch_upload(audio_path: Path, *, lang: str = "ja"):
+    """チャンクが届いた時点でアップロードを先行して始める（文字起こしがキャッシュ済みなら何もしない）"""
+    sha = file_sha256(audio_path)
+    if get_transcript_cache().contains(get_transcript_cache().make_key(sha, TRANSCRIBE_MODEL, lang)):
+        return
+    get_upload_manager().prefetch(audio_path, sha)
 
 
 # ─────────────────────────────────────────
 # 1) Gemini API で音声ファイルの文字起こし
 # ─────────────────────────────────────────
+@cached_transcription(TRANSCRIBE_MODEL)
 def transcribe_audio(audio_path: Path, *, lang: str = "ja") -> str:
     """
-    音声ファイルをアップロードし、generate_content で文字起こしを取得する
+    音声ファイルをアップロードし（アップロード済みなら再利用し）、generate_content で文字起こしを取得する
     """
-    # 1) ファイルをアップロード
-    myfile = client.files.upload(
-        file=str(audio_path),
-        # mime_type は省略可。SDK が自動判別します。
-    )  # :contentReference[oaicite:1]{index=1}
-
-    # 2) 文字起こしプロンプトを投げる
+    client = get_client()
+    uploads = get_upload_manager()
     prompt = f"言語は{lang}で、以下の音声を文字起こししてください。"
-    resp = client.models.generate_content(
-        model=TRANSCRIBE_MODEL,
-        contents=[prompt, myfile],
-        tempreture=0,  # 再現性のため温度を0に設定
-    )  # :contentReference[oaicite:2]{index=2}
+
+    def _generate(myfile):
+        with metrics.span("transcribe", provider="gemini", model=TRANSCRIBE_MODEL, audio=True,
+                          bytes_in=Path(audio_path).stat().st_size) as sp:
+            resp = _guard(TRANSCRIBE_MODEL).call(lambda: client.models.generate_content(
+                model=TRANSCRIBE_MODEL,
+                contents=[prompt, myfile],
+                config=_config(TRANSCRIBE_TIMEOUT),
+            ))  # :contentReference[oaicite:2]{index=2}
+            _add_usage(sp, resp)
+            sp.bytes_out = len((resp.text or "").encode())
+        return resp
+
+    # 1) ファイルをアップロード  2) 文字起こしプロンプトを投げる
+    sha, myfile = uploads.get(audio_path)
+    try:
+        resp = _generate(myfile)
+    except Exception as e:  # noqa: BLE001
+        # 再利用したファイルがサーバー側で消えていた場合は 1 回だけアップロードし直す
+        if status_of(e) not in (403, 404):
+            raise
+        uploads.forget(sha)
+        sha, myfile = uploads.get(audio_path)
+        resp = _generate(myfile)
 
     text = resp.text or ""
     if not text.strip():
         raise ValueError("文字起こし結果が空です。音声ファイルを確認してください。")
+    uploads.release(sha)
     return text.strip()
 
 
 # ─────────────────────────────────────────
 # 4) テンプレート適用
+#    長い文字起こしは部分ごとに並列で要約（map）し、
+#    部分要約をテンプレートに沿ってまとめる（reduce）
 # ─────────────────────────────────────────
-def generate_minutes(transcript: str, template_str: str) -> str:
-    prompt = (
-        "あなたは日本語の議事録作成アシスタントです。"
-        "以下のテンプレートに従って、文字起こしデータを要約して議事録としてまとめてください。"
-    )
-    resp = client.models.generate_content(
-        model=GENERATION_MODEL,
-        contents=[prompt, 
-                  "\n".join(template_str),
-                  "\n以下文字起こしデータ：",
-                  "\n".join(transcript)],
-        tempreture=0, # 再現性のため温度を0に設定
-    )
-    return resp.text.strip()
+def _map_contents(part: str, index: int, total: int) -> list:
+    return [MAP_INSTRUCTION.format(index=index, total=total), part]
+
+
+def _transcript_contents(transcript: str, *, use_cache: bool) -> list:
+    """プロンプトに入れる文字起こし。MAP_REDUCE_TOKENS を超える場合は部分要約を連結したものにする"""
+    if estimate_tokens(transcript) <= MAP_REDUCE_TOKENS:
+        return ["\n以下文字起こしデータ：", transcript]
+    parts = split_transcript(transcript, MAP_CHUNK_TOKENS)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="gemini-map") as ex:
+        summaries = list(ex.map(
+            metrics.bind(lambda a: _generate_cached(_map_contents(a[1], a[0], len(parts)),
+                                                    use_cache=use_cache, stage="map")),
+            enumerate(parts, start=1)))
+    body = "\n\n".join(f"### 部分 {i}/{len(parts)}\n{s}" for i, s in enumerate(summaries, start=1))
+    return ["\n以下は長い会議の文字起こしを前から順に部分ごとに要約したものです：", body]
+
+
+def _minutes_contents(transcript: str, template_str: str, *, use_cache: bool = True) -> list:
+    # 文字列を "\n".join すると 1 文字ごとに改行が入り入力が倍増するため、そのまま渡す
+    return [MINUTES_INSTRUCTION, template_str] + _transcript_contents(transcript, use_cache=use_cache)
+
+
+def generate_minutes(transcript: str, template_str: str, *, use_cache: bool = True) -> str:
+    return _generate_cached(_minutes_contents(transcript, template_str, use_cache=use_cache),
+                            use_cache=use_cache, stage="minutes")
+
+
+def generate_minutes_stream(transcript: str, template_str: str, *, use_cache: bool = True) -> Iterator[str]:
+    """generate_minutes のストリーミング版（生成されたテキストを順次 yield）"""
+    return _generate_stream_cached(_minutes_contents(transcript, template_str, use_cache=use_cache),
+                                   use_cache=use_cache, stage="minutes")
 
     
    # return Template(template_str).render(
@@ -71,26 +289,24 @@ def generate_minutes(transcript: str, template_str: str) -> str:
    # )
 
 
-def generate_next_agenda(transcript: str, template_str: str, db) -> str:
-    last = db.fetch_latest_minutes()
-    prev_md = last.get("minutes_md") if last else None
-    
-    prompt = (
-        "あなたはプロのファシリテーターです。"
-        "会議文字起こしと（あれば）前回議事録をもとに、"
-        "## 次回アジェンダ と ## 宿題・タスク を Markdown 形式で作成してください。"
-        "- 宿題には担当者・期日を含める"
-    )
-    
-    resp = client.models.generate_content(
-        model=GENERATION_MODEL,
-        contents=[prompt, 
-                  "\n".join(template_str),
-                  "\n以下文字起こしデータ：",
-                  "\n".join(transcript)
-                  ] + ([prev_md] if prev_md else []),
-    )
-    return resp.text.strip()
+def _agenda_contents(transcript: str, template_str: str, open_tasks: List[Dict], *,
+                     use_cache: bool = True) -> list:
+    return ([AGENDA_INSTRUCTION, template_str]
+            + _transcript_contents(transcript, use_cache=use_cache)
+            + ([OPEN_TASKS_HEADER.format(tasks=format_open_tasks(open_tasks))] if open_tasks else []))
+
+
+def generate_next_agenda(transcript: str, template_str: str, open_tasks: List[Dict], *,
+                         use_cache: bool = True) -> str:
+    return _generate_cached(_agenda_contents(transcript, template_str, open_tasks, use_cache=use_cache),
+                            use_cache=use_cache, stage="agenda")
+
+
+def generate_next_agenda_stream(transcript: str, template_str: str, open_tasks: List[Dict], *,
+                                use_cache: bool = True) -> Iterator[str]:
+    """generate_next_agenda のストリーミング版（生成されたテキストを順次 yield）"""
+    return _generate_stream_cached(_agenda_contents(transcript, template_str, open_tasks, use_cache=use_cache),
+                                   use_cache=use_cache, stage="agenda")
 
 
     
@@ -100,4 +316,57 @@ def generate_next_agenda(transcript: str, template_str: str, db) -> str:
     #    agenda=agenda_body,
     #    now=dt.datetime.now().strftime("%Y-%m-%d %H:%M"),
     #)
-# ─────────────────────────────────────────
\ No newline at end of file
+# ─────────────────────────────────────────
+
+def _add_usage(sp, resp):
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is not None:
+        sp.add_usage(usage.prompt_token_count, usage.candidates_token_count)
+
+
+def _prompt_bytes(contents: list) -> int:
+    return sum(len(c.encode()) for c in contents if isinstance(c, str))
+
+
+def _generate_cached(contents: list, *, use_cache: bool, stage: str = "generate") -> str:
+    """temperature=0 の出力は入力で決まるため、contents をキーにキャッシュする"""
+    def _call() -> str:
+        with metrics.span(stage, provider="gemini", model=GENERATION_MODEL, bytes_in=_prompt_bytes(contents)) as sp:
+            resp = _guard(GENERATION_MODEL).call(lambda: get_client().models.generate_content(
+                model=GENERATION_MODEL,
+                contents=contents,
+                config=_config(GENERATION_TIMEOUT),
+            ), tokens=_tokens(contents))
+            text = resp.text.strip()
+            _add_usage(sp, resp)
+            sp.bytes_out = len(text.encode())
+        return text
+
+    return cached_generation("gemini", GENERATION_MODEL, contents, _call, use_cache=use_cache)
+
+
+def _generate_stream_cached(contents: list, *, use_cache: bool, stage: str = "generate") -> Iterator[str]:
+    last = {}
+
+    def _open() -> Iterator[str]:
+        for chunk in get_client().models.generate_content_stream(
+            model=GENERATION_MODEL,
+            contents=contents,
+            config=_config(GENERATION_TIMEOUT),
+        ):
+            # usage_metadata はチャンクごとの累計なので最後のものを使う
+            if getattr(chunk, "usage_metadata", None) is not None:
+                last["resp"] = chunk
+            if chunk.text:
+                yield chunk.text
+
+    def _stream() -> Iterator[str]:
+        # 最初のトークンより前の失敗だけ再試行する（途中まで表示した出力を重複させない）
+        with metrics.span(stage, provider="gemini", model=GENERATION_MODEL, bytes_in=_prompt_bytes(contents)) as sp:
+            for piece in _guard(GENERATION_MODEL).stream(_open, tokens=_tokens(contents)):
+                sp.bytes_out += len(piece.encode())
+                yield piece
+            if "resp" in last:
+                _add_usage(sp, last["resp"])
+
+    return cached_generation_stream("gemini", GENERATION_MODEL, contents, _stream, use_cache=use_cache)
@@ -4,85 +4,230 @@
 from pathlib import Path
 import os
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterator, List
 
-import openai              # pip install openai
+import metrics
+from cache import cached_generation, cached_generation_stream, cached_transcription
+from resilience import get_guard
+from action_items import format_open_tasks
+from templates import AGENDA_INSTRUCTION, MAP_INSTRUCTION, MINUTES_INSTRUCTION, OPEN_TASKS_HEADER
+from transcript_utils import estimate_tokens, split_transcript
 #from jinja2 import Template
 
 # ─────────────────────────────────────────
 # OpenAI API キー & 共通設定
+#   openai / streamlit の import とクライアント生成は初回利用時まで遅らせる
 # ─────────────────────────────────────────
-import streamlit as st
-openai.api_key = os.getenv("OPENAI_API_KEY") or st.secrets["OPENAI_API_KEY"]
+def _api_key() -> str:
+    key = os.getenv("OPENAI_API_KEY")
+    if key:
+        return key
+    import streamlit as st
+    return st.secrets["OPENAI_API_KEY"]
+
+
+@lru_cache(maxsize=1)
+def get_client():
+    """プロセス内で共有する OpenAI クライアント（HTTP 接続はプールして再利用）"""
+    import httpx
+    import openai              # pip install openai
+    return openai.OpenAI(
+        api_key=_api_key(),
+        max_retries=0,  # 再試行は resilience.Guard でまとめて行う
+        http_client=openai.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=4 * MAX_CONCURRENCY,
+                                max_keepalive_connections=2 * MAX_CONCURRENCY),
+        ),
+    )
+
 
 TRANSCRIBE_MODEL = "gpt-4o-mini-transcribe" 
 GPT_MODEL        = "gpt-4o-mini"
+MAX_CONCURRENCY  = 4   # 文字起こしの同時リクエスト数
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024  # transcriptions API のファイルサイズ上限
+MAX_AUDIO_SECONDS = 1400             # 1 リクエストの音声長上限（1500 秒）に余裕を持たせた値
+TRANSCRIBE_TIMEOUT = 300  # 1 リクエストのタイムアウト（秒）
+GENERATION_TIMEOUT = 120
+OUTPUT_TOKENS      = 2000  # tokens/min の見積もりに加える出力トークン数
+MAP_REDUCE_TOKENS  = 60_000  # 文字起こしがこれを超えたら部分ごとに要約してからまとめる
+MAP_CHUNK_TOKENS   = 15_000  # 部分要約 1 回あたりの入力トークン数
+
+# モデルごとのレート上限 (requests/min, tokens/min)。アカウントの Tier に合わせて調整する
+RATE_LIMITS = {
+    TRANSCRIBE_MODEL: (500, None),
+    GPT_MODEL:        (500, 200_000),
+}
+
+
+def _guard(model: str):
+    rpm, tpm = RATE_LIMITS.get(model, (None, None))
+    return get_guard("openai", model, rpm=rpm, tpm=tpm)
+
 
 # ─────────────────────────────────────────
 # 1) Whisper API で文字起こし
 #    ※ ffmpeg 変換に失敗したらそのまま送信
 # ─────────────────────────────────────────
+@cached_transcription(TRANSCRIBE_MODEL)
 def transcribe_audio(audio_path: Path, *, lang: str = "ja") -> str:
     """音声ファイルを文字起こし  
        - ffmpeg で WAV 化を試みる  
        - 失敗したら元ファイルをそのまま Whisper へ
     """
     audio_to_send = audio_path
-    with open(audio_to_send, "rb") as f:
-        resp = openai.audio.transcriptions.create(
-            model=TRANSCRIBE_MODEL,
-            file=f,
-            language=lang,
-            response_format="text",
-        )
-    return resp  # str
+
+    def _call():
+        # 再試行のたびにファイルを開き直す
+        with open(audio_to_send, "rb") as f:
+            return get_client().audio.transcriptions.create(
+                model=TRANSCRIBE_MODEL,
+                file=f,
+                language=lang,
+                response_format="json",  # usage（トークン数）を受け取るため json で受ける
+                timeout=TRANSCRIBE_TIMEOUT,
+            )
+
+    with metrics.span("transcribe", provider="openai", model=TRANSCRIBE_MODEL, audio=True,
+                      bytes_in=Path(audio_path).stat().st_size) as sp:
+        resp = _guard(TRANSCRIBE_MODEL).call(_call)
+        usage = getattr(resp, "usage", None)
+        sp.add_usage(getattr(usage, "input_tokens", 0), getattr(usage, "output_tokens", 0))
+        sp.bytes_out = len(resp.text.encode())
+    return resp.text  # str
 #    resp = resp["text"].strip()  # str
 
 
 # ─────────────────────────────────────────
 # 2) GPT-4o-mini で要約
+#    長い文字起こしは部分ごとに並列で要約（map）し、
+#    部分要約をテンプレートに沿ってまとめる（reduce）
 # ─────────────────────────────────────────
-def generate_minutes(transcript: str, template_str: str) -> str:
-    """GPT-4o-mini で要約・議事録生成"""
-    messages = [
-        {"role": "system", "content": (
-            "あなたは日本語の議事録作成アシスタントです。"
-            "以下のテンプレートに従って、文字起こしデータを要約して議事録としてまとめてください。"
-        )},
+def _map_messages(part: str, index: int, total: int) -> list:
+    return [
+        {"role": "system", "content": MAP_INSTRUCTION.format(index=index, total=total)},
+        {"role": "user", "content": part},
+    ]
+
+
+def _transcript_content(transcript: str, *, use_cache: bool) -> str:
+    """プロンプトに入れる文字起こし。MAP_REDUCE_TOKENS を超える場合は部分要約を連結したものにする"""
+    if estimate_tokens(transcript) <= MAP_REDUCE_TOKENS:
+        return f"以下文字起こしデータ：\n{transcript}"
+    parts = split_transcript(transcript, MAP_CHUNK_TOKENS)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="openai-map") as ex:
+        summaries = list(ex.map(
+            metrics.bind(lambda a: _chat_cached(_map_messages(a[1], a[0], len(parts)),
+                                                use_cache=use_cache, stage="map")),
+            enumerate(parts, start=1)))
+    body = "\n\n".join(f"### 部分 {i}/{len(parts)}\n{s}" for i, s in enumerate(summaries, start=1))
+    return f"以下は長い会議の文字起こしを前から順に部分ごとに要約したものです：\n{body}"
+
+
+def _minutes_messages(transcript: str, template_str: str, *, use_cache: bool = True) -> list:
+    return [
+        {"role": "system", "content": MINUTES_INSTRUCTION},
         {"role": "system", "content": template_str},
-        {"role": "user", "content": f"以下文字起こしデータ：\n{transcript}"},
+        {"role": "user", "content": _transcript_content(transcript, use_cache=use_cache)},
     ]
-    resp = openai.chat.completions.create(
-        model=GPT_MODEL,
-        messages=messages,
-        temperature=0,  # 再現性のため温度を0に設定
-    )
-    return resp.choices[0].message.content.strip()
+
+
+def generate_minutes(transcript: str, template_str: str, *, use_cache: bool = True) -> str:
+    """GPT-4o-mini で要約・議事録生成（use_cache=False で生成キャッシュを無視）"""
+    return _chat_cached(_minutes_messages(transcript, template_str, use_cache=use_cache),
+                        use_cache=use_cache, stage="minutes")
+
+
+def generate_minutes_stream(transcript: str, template_str: str, *, use_cache: bool = True) -> Iterator[str]:
+    """generate_minutes のストリーミング版（生成されたテキストを順次 yield）"""
+    return _chat_stream_cached(_minutes_messages(transcript, template_str, use_cache=use_cache),
+                               use_cache=use_cache, stage="minutes")
 
 # ─────────────────────────────────────────
 # 3) GPT-4o-mini で次回アジェンダ生成
 # ─────────────────────────────────────────
-def generate_next_agenda(transcript: str, template_str: str, db) -> str:
-    """GPT-4o-mini で次回アジェンダ生成"""
-    last = db.fetch_latest_minutes()
-    prev_md = last.get("minutes_md") if last else None
-
-    system_prompt = (
-        "あなたはプロのファシリテーターです。"
-        "会議文字起こしと（あれば）前回議事録をもとに、"
-        "## 次回アジェンダ と ## 宿題・タスク を Markdown 形式で作成してください。"
-        "- 宿題には担当者・期日を含める"
-    )
+def _agenda_messages(transcript: str, template_str: str, open_tasks: List[Dict], *,
+                     use_cache: bool = True) -> list:
     messages = [
-        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": AGENDA_INSTRUCTION},
         {"role": "system", "content": template_str},
-        {"role": "user", "content": f"以下文字起こしデータ：\n{transcript}"},
+        {"role": "user", "content": _transcript_content(transcript, use_cache=use_cache)},
     ]
-    if prev_md:
-        messages.append({"role": "assistant", "content": prev_md})
+    if open_tasks:
+        messages.append({"role": "user", "content": OPEN_TASKS_HEADER.format(tasks=format_open_tasks(open_tasks))})
+    return messages
 
-    resp = openai.chat.completions.create(
-        model=GPT_MODEL,
-        messages=messages,
-        temperature=0, # 再現性のため温度を0に設定
-    )
-    return resp.choices[0].message.content.strip()
+
+def generate_next_agenda(transcript: str, template_str: str, open_tasks: List[Dict], *,
+                         use_cache: bool = True) -> str:
+    """GPT-4o-mini で次回アジェンダ生成（use_cache=False で生成キャッシュを無視）"""
+    return _chat_cached(_agenda_messages(transcript, template_str, open_tasks, use_cache=use_cache),
+                        use_cache=use_cache, stage="agenda")
+
+
+def generate_next_agenda_stream(transcript: str, template_str: str, open_tasks: List[Dict], *,
+                                use_cache: bool = True) -> Iterator[str]:
+    """generate_next_agenda のストリーミング版（生成されたテキストを順次 yield）"""
+    return _chat_stream_cached(_agenda_messages(transcript, template_str, open_tasks, use_cache=use_cache),
+                               use_cache=use_cache, stage="agenda")
+
+
+def _cache_parts(messages: list) -> list:
+    return [f"{m['role']}\n{m['content']}" for m in messages]
+
+
+def _tokens(messages: list) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages) + OUTPUT_TOKENS
+
+
+def _prompt_bytes(messages: list) -> int:
+    return sum(len(m["content"].encode()) for m in messages)
+
+
+def _chat_cached(messages: list, *, use_cache: bool, stage: str = "generate") -> str:
+    """temperature=0 の出力は入力で決まるため、メッセージ列をキーにキャッシュする"""
+    def _call() -> str:
+        with metrics.span(stage, provider="openai", model=GPT_MODEL, bytes_in=_prompt_bytes(messages)) as sp:
+            resp = _guard(GPT_MODEL).call(lambda: get_client().chat.completions.create(
+                model=GPT_MODEL,
+                messages=messages,
+                temperature=0,  # 再現性のため温度を0に設定
+                timeout=GENERATION_TIMEOUT,
+            ), tokens=_tokens(messages))
+            text = resp.choices[0].message.content.strip()
+            if resp.usage:
+                sp.add_usage(resp.usage.prompt_tokens, resp.usage.completion_tokens)
+            sp.bytes_out = len(text.encode())
+        return text
+
+    return cached_generation("openai", GPT_MODEL, _cache_parts(messages), _call, use_cache=use_cache)
+
+
+def _chat_stream_cached(messages: list, *, use_cache: bool, stage: str = "generate") -> Iterator[str]:
+    usage = {}
+
+    def _open() -> Iterator[str]:
+        stream = get_client().chat.completions.create(
+            model=GPT_MODEL,
+            messages=messages,
+            temperature=0,  # 再現性のため温度を0に設定
+            stream=True,
+            stream_options={"include_usage": True},  # 最後のチャンクで usage を受け取る
+            timeout=GENERATION_TIMEOUT,
+        )
+        for chunk in stream:
+            if chunk.usage:
+                usage.update(prompt=chunk.usage.prompt_tokens, completion=chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _stream() -> Iterator[str]:
+        # 最初のトークンより前の失敗だけ再試行する（途中まで表示した出力を重複させない）
+        with metrics.span(stage, provider="openai", model=GPT_MODEL, bytes_in=_prompt_bytes(messages)) as sp:
+            for piece in _guard(GPT_MODEL).stream(_open, tokens=_tokens(messages)):
+                sp.bytes_out += len(piece.encode())
+                yield piece
+            sp.add_usage(usage.get("prompt"), usage.get("completion"))
+
+    return cached_generation_stream("openai", GPT_MODEL, _cache_parts(messages), _stream, use_cache=use_cache)
@@ -1,29 +1,367 @@
+import re
 import sqlite3
+import threading
+import datetime as dt
+import zlib
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
+
+from action_items import extract_items
+
+try:
+    import zstandard  # 任意。入っていれば zlib より高速・高圧縮な zstd で保存する
+except ImportError:
+    zstandard = None
+
+# 履歴ページングのカーソル（created_at, id）
+Cursor = Tuple[str, int]
+
+# PRAGMA user_version で管理するスキーマのバージョン
+#   1: transcript / minutes_md を圧縮 BLOB で保存し、文字数を別カラムに持つ。FTS は contentless
+#   2: 元音声の SHA-256 とプロバイダ名を持つ（一括処理で処理済みのファイルを飛ばすため）
+#   3: 決定事項・タスクを tasks へ取り込み済みかを tasks_extracted で持つ
+SCHEMA_VERSION = 3
+COMPRESS_MIN_BYTES = 256  # これより短い本文は圧縮せず TEXT のまま保存する
+
+# 圧縮 BLOB の先頭 1 バイトで方式を区別する（TEXT のままの行は旧形式または短い本文）
+_CODEC_ZLIB = b"\x01"
+_CODEC_ZSTD = b"\x02"
+
+
+def _compress(text: Optional[str]) -> Union[str, bytes, None]:
+    if text is None:
+        return None
+    raw = text.encode()
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return text
+    if zstandard is not None:
+        packed = _CODEC_ZSTD + zstandard.ZstdCompressor(level=10).compress(raw)
+    else:
+        packed = _CODEC_ZLIB + zlib.compress(raw, 6)
+    return packed if len(packed) < len(raw) else text
+
+
+def _decompress(value: Union[str, bytes, None]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    codec, body = bytes(value[:1]), bytes(value[1:])
+    if codec == _CODEC_ZLIB:
+        return zlib.decompress(body).decode()
+    if codec == _CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstd で圧縮された議事録を読むには zstandard パッケージが必要です")
+        return zstandard.ZstdDecompressor().decompress(body).decode()
+    raise ValueError(f"未知の圧縮形式です: {codec!r}")
+
+
+def _parse_ts(value: Optional[str]) -> Optional[dt.datetime]:
+    return dt.datetime.fromisoformat(value) if value else None
+
+
+def _fts_query(query: str) -> str:
+    """空白区切りの各語をフレーズとして AND 検索する FTS5 クエリに変換する"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+_WORD_RUN = re.compile(r"[^\W_]+")
+
+
+def _bigrams(text: Optional[str]) -> str:
+    """文字の並びを 2 文字ずつずらして空白で区切る（minutes_bigram の索引用）。
+       各並びの末尾 1 文字も加え、1 文字の語は前方一致（"田"*）で引けるようにする。
+    """
+    grams = []
+    for run in _WORD_RUN.findall(text or ""):
+        grams += [run[i:i + 2] for i in range(len(run) - 1)]
+        grams.append(run[-1])
+    return " ".join(grams)
+
+
+def _bigram_query(query: str) -> str:
+    """各語を 2 文字ずつのフレーズ（1 文字なら前方一致）にして AND 検索する minutes_bigram 用のクエリ"""
+    phrases = []
+    for run in _WORD_RUN.findall(query):
+        if len(run) == 1:
+            phrases.append(f'"{run}"*')
+        else:
+            phrases.append('"' + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+    return " ".join(phrases)
+
+
+def _make_snippet(text: str, term: str, width: int = 40) -> str:
+    """最初の一致箇所の前後を切り出して強調する"""
+    pos = text.find(term)
+    if pos < 0:
+        return text[: width * 2] + ("…" if len(text) > width * 2 else "")
+    start, end = max(pos - width, 0), min(pos + len(term) + width, len(text))
+    return (("…" if start > 0 else "") + text[start:pos] + f"**{term}**"
+            + text[pos + len(term):end] + ("…" if end < len(text) else ""))
+
 
 class MinutesDB:
     def __init__(self, db_path: Path):
-        self.conn = sqlite3.connect(db_path)
+        self.path = Path(db_path)
+        # パイプラインのワーカースレッドからも参照するため、接続を共有してロックで直列化する
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        # 検索（LIKE）や取り込み時に SQL の中から本文を展開できるようにする
+        self.conn.create_function("unz", 1, _decompress, deterministic=True)
         self.conn.execute("""CREATE TABLE IF NOT EXISTS minutes
             (id INTEGER PRIMARY KEY AUTOINCREMENT,
              title TEXT,
-             transcript TEXT,
-             minutes_md TEXT,
-             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+             transcript BLOB,
+             minutes_md BLOB,
+             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+             transcript_chars INTEGER,
+             minutes_chars INTEGER,
+             source_sha256 TEXT,
+             provider TEXT,
+             tasks_extracted INTEGER DEFAULT 0)""")
+        # 新しい順の一覧・ページングを索引だけで引けるようにする
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_minutes_created_at ON minutes(created_at DESC, id DESC)")
+        # 議事録から抜き出した決定事項（◆）とタスク（★担当者　期限）。タスクは status で完了を管理する
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS tasks
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             minutes_id INTEGER,
+             kind TEXT,
+             text TEXT,
+             assignee TEXT,
+             due TEXT,
+             topic TEXT,
+             status TEXT,
+             created_at TIMESTAMP,
+             closed_at TIMESTAMP)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(kind, status, created_at DESC)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_minutes ON tasks(minutes_id)")
         self.conn.commit()
+        self._migrate()
+        self.fts_enabled = self._init_fts()
+        self._init_tasks()
 
-    def save_minutes(self, title: str, transcript: str, minutes_md: str):
-        self.conn.execute(
-            "INSERT INTO minutes (title, transcript, minutes_md) VALUES (?,?,?)",
-            (title, transcript, minutes_md))
+    def _migrate(self):
+        """user_version が古い DB を SCHEMA_VERSION の形式に移行する"""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(minutes)")}
+        for name, sql_type in (("transcript_chars", "INTEGER"), ("minutes_chars", "INTEGER"),
+                               ("source_sha256", "TEXT"), ("provider", "TEXT"),
+                               ("tasks_extracted", "INTEGER DEFAULT 0")):
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE minutes ADD COLUMN {name} {sql_type}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_minutes_source ON minutes(source_sha256)")
+        if 1 <= version < 3:
+            # バージョン 1・2 の DB は開くたびに全件を取り込み済みなので、そのまま済みにする
+            self.conn.execute("UPDATE minutes SET tasks_extracted=1")
+        compressed = 0
+        if version < 1:
+            ids = [row[0] for row in self.conn.execute("SELECT id FROM minutes ORDER BY id")]
+            for minutes_id in ids:
+                transcript, minutes_md = self.conn.execute(
+                    "SELECT unz(transcript), unz(minutes_md) FROM minutes WHERE id=?", (minutes_id,)).fetchone()
+                self.conn.execute(
+                    "UPDATE minutes SET transcript=?, minutes_md=?, transcript_chars=?, minutes_chars=? WHERE id=?",
+                    (_compress(transcript), _compress(minutes_md),
+                     len(transcript or ""), len(minutes_md or ""), minutes_id))
+            compressed = len(ids)
+            # 本文のコピーを持つ旧 FTS テーブルは捨て、_init_fts で contentless として作り直す
+            self.conn.execute("DROP TABLE IF EXISTS minutes_fts")
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.commit()
+        if compressed:
+            self.conn.execute("VACUUM")  # 圧縮で空いたページをファイルから解放する
+
+    def _init_fts(self) -> bool:
+        """全文検索用の FTS5 テーブル（日本語向けに trigram トークナイザ）を用意し、未登録の行を取り込む。
+           本文は minutes に圧縮して持つので、FTS 側は索引だけの contentless テーブルにする。
+           trigram では引けない 1〜2 文字の語（姓・2 文字の単語）用に、2 文字ずつ区切った本文の
+           索引 minutes_bigram も持つ。
+        """
+        try:
+            self.conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS minutes_fts
+                USING fts5(title, transcript, minutes_md, content='', tokenize='trigram')""")
+            self.conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS minutes_bigram
+                USING fts5(title, transcript, minutes_md, content='', tokenize='unicode61')""")
+        except sqlite3.OperationalError:
+            # FTS5 / trigram に対応していない SQLite では LIKE 検索にフォールバック
+            return False
+        self.conn.execute("""INSERT INTO minutes_fts (rowid, title, transcript, minutes_md)
+            SELECT id, title, unz(transcript), unz(minutes_md) FROM minutes
+            WHERE id > (SELECT COALESCE(MAX(rowid), 0) FROM minutes_fts)""")
+        rows = self.conn.execute(
+            "SELECT id, title, unz(transcript), unz(minutes_md) FROM minutes "
+            "WHERE id > (SELECT COALESCE(MAX(rowid), 0) FROM minutes_bigram) ORDER BY id")
+        self.conn.executemany(
+            "INSERT INTO minutes_bigram (rowid, title, transcript, minutes_md) VALUES (?,?,?,?)",
+            ((i, _bigrams(title), _bigrams(transcript), _bigrams(minutes_md))
+             for i, title, transcript, minutes_md in rows))
         self.conn.commit()
+        return True
+
+    def _init_tasks(self):
+        """tasks テーブルができる前に保存された議事録からも決定事項・タスクを取り込む
+           （取り込み済みの行は tasks_extracted で印を付け、完了にしたタスクを再び取り込まない）
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, unz(minutes_md) FROM minutes WHERE tasks_extracted=0 ORDER BY id").fetchall()
+            for minutes_id, minutes_md in rows:
+                self._insert_items(minutes_id, minutes_md)
+            self.conn.commit()
+
+    def _insert_items(self, minutes_id: int, minutes_md: str):
+        self.conn.execute("UPDATE minutes SET tasks_extracted=1 WHERE id=?", (minutes_id,))
+        if self.conn.execute(
+                """SELECT 1 FROM minutes AS m JOIN minutes AS first ON first.source_sha256 = m.source_sha256
+                   WHERE m.id=? AND first.id < m.id""", (minutes_id,)).fetchone():
+            # 同じ録音の別プロバイダの議事録は言い回しが違うだけなので、最初に保存したものからだけ取り込む
+            return
+        for item in extract_items(minutes_md):
+            if item["kind"] == "task" and self.conn.execute(
+                    "SELECT 1 FROM tasks WHERE kind='task' AND status='open' AND text=? AND assignee=?",
+                    (item["text"], item["assignee"])).fetchone():
+                continue  # 前回から持ち越した同じ宿題は 1 件のままにする
+            self.conn.execute(
+                "INSERT INTO tasks (minutes_id, kind, text, assignee, due, topic, status, created_at) "
+                "VALUES (?,?,?,?,?,?,?,(SELECT created_at FROM minutes WHERE id=?))",
+                (minutes_id, item["kind"], item["text"], item["assignee"], item["due"], item["topic"],
+                 "open" if item["kind"] == "task" else "decided", minutes_id))
+
+    def save_minutes(self, title: str, transcript: str, minutes_md: str, *,
+                     provider: Optional[str] = None, source_sha256: Optional[str] = None):
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO minutes (title, transcript, minutes_md, transcript_chars, minutes_chars, "
+                "provider, source_sha256) VALUES (?,?,?,?,?,?,?)",
+                (title, _compress(transcript), _compress(minutes_md), len(transcript or ""), len(minutes_md or ""),
+                 provider, source_sha256))
+            if self.fts_enabled:
+                self.conn.execute(
+                    "INSERT INTO minutes_fts (rowid, title, transcript, minutes_md) VALUES (?,?,?,?)",
+                    (cur.lastrowid, title, transcript, minutes_md))
+                self.conn.execute(
+                    "INSERT INTO minutes_bigram (rowid, title, transcript, minutes_md) VALUES (?,?,?,?)",
+                    (cur.lastrowid, _bigrams(title), _bigrams(transcript), _bigrams(minutes_md)))
+            self._insert_items(cur.lastrowid, minutes_md)
+            self.conn.commit()
 
     def fetch_all_minutes(self) -> List[Dict]:
-        cur = self.conn.execute("SELECT title, minutes_md FROM minutes ORDER BY created_at DESC")
-        return [dict(title=row[0], minutes_md=row[1]) for row in cur.fetchall()]
+        """全件を本文込みで返す（件数が多いと重いので、画面表示には fetch_minutes_page を使う）"""
+        with self._lock:
+            cur = self.conn.execute(
+                "SELECT id, title, transcript, minutes_md, created_at FROM minutes "
+                "ORDER BY created_at DESC, id DESC")
+            rows = cur.fetchall()
+        return [dict(id=row[0], title=row[1], transcript=_decompress(row[2]), minutes_md=_decompress(row[3]),
+                     created_at=_parse_ts(row[4])) for row in rows]
+
+    def providers_for_source(self, source_sha256: str) -> set:
+        """元音声の SHA-256 が同じ議事録を保存済みのプロバイダ名を返す"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT provider FROM minutes WHERE source_sha256=?", (source_sha256,)).fetchall()
+        return {r[0] for r in rows}
 
     def fetch_latest_minutes(self):
-        cur = self.conn.execute("SELECT title, minutes_md FROM minutes ORDER BY created_at DESC LIMIT 1")
-        row = cur.fetchone()
-        return dict(title=row[0], minutes_md=row[1]) if row else None
+        with self._lock:
+            cur = self.conn.execute(
+                "SELECT title, minutes_md FROM minutes ORDER BY created_at DESC, id DESC LIMIT 1")
+            row = cur.fetchone()
+        return dict(title=row[0], minutes_md=_decompress(row[1])) if row else None
+
+    # ─────────────────────────────────────────
+    # 決定事項・タスク
+    # ─────────────────────────────────────────
+    def fetch_open_tasks(self, limit: int = 50) -> List[Dict]:
+        """未完了のタスクを新しい順に limit 件返す（会議をまたいで集計）"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT t.id, t.text, t.assignee, t.due, t.topic, t.created_at, m.title FROM tasks AS t "
+                "LEFT JOIN minutes AS m ON m.id = t.minutes_id "
+                "WHERE t.kind='task' AND t.status='open' ORDER BY t.created_at DESC, t.id DESC LIMIT ?",
+                (limit,)).fetchall()
+        return [dict(id=r[0], text=r[1], assignee=r[2], due=r[3], topic=r[4],
+                     created_at=_parse_ts(r[5]), title=r[6]) for r in rows]
+
+    def set_task_status(self, task_id: int, status: str):
+        """status は "open" / "done" / "dropped"（完了・取り下げ時に closed_at を記録）"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE tasks SET status=?, closed_at=CASE WHEN ?='open' THEN NULL ELSE CURRENT_TIMESTAMP END "
+                "WHERE id=? AND kind='task'", (status, status, task_id))
+            self.conn.commit()
+
+    # ─────────────────────────────────────────
+    # 履歴表示用（一覧はサマリのみ、本文は開いたときに取得）
+    # ─────────────────────────────────────────
+    def count_minutes(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM minutes").fetchone()[0]
+
+    def fetch_minutes_page(self, limit: int = 20, before: Optional[Cursor] = None) -> List[Dict]:
+        """新しい順に limit 件のサマリ（タイトル・保存日時・文字数）を返す。
+           before に前ページ最後の行の cursor を渡すと、その続きを返す（キーセットページング）。
+        """
+        sql = ("SELECT id, title, created_at, transcript_chars, minutes_chars FROM minutes ")
+        params: tuple = ()
+        if before is not None:
+            sql += "WHERE (created_at, id) < (?, ?) "
+            params = tuple(before)
+        sql += "ORDER BY created_at DESC, id DESC LIMIT ?"
+        with self._lock:
+            rows = self.conn.execute(sql, params + (limit,)).fetchall()
+        return [dict(id=row[0], title=row[1], created_at=_parse_ts(row[2]),
+                     transcript_chars=row[3] or 0, minutes_chars=row[4] or 0,
+                     cursor=(row[2], row[0])) for row in rows]
+
+    def fetch_minutes(self, minutes_id: int) -> Optional[Dict]:
+        """1 件分の本文（文字起こし・議事録）を返す（展開するのはここだけ）"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, title, transcript, minutes_md, created_at FROM minutes WHERE id=?",
+                (minutes_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(id=row[0], title=row[1], transcript=_decompress(row[2]), minutes_md=_decompress(row[3]),
+                    created_at=_parse_ts(row[4]))
+
+    # ─────────────────────────────────────────
+    # 全文検索
+    # ─────────────────────────────────────────
+    def search_minutes(self, query: str, limit: int = 20) -> List[Dict]:
+        """文字起こし・議事録・タイトルを全文検索し、関連度順にスニペット付きのサマリを返す。
+           trigram は 3 文字未満の語を索引で引けないため、その場合は minutes_bigram で引く。
+           記号だけの語など索引で引けないときは LIKE で新しい順に探す。
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        fts_table, fts_query = None, ""
+        if self.fts_enabled and all(len(t) >= 3 for t in terms):
+            fts_table, fts_query = "minutes_fts", _fts_query(query)
+        elif self.fts_enabled and all(_WORD_RUN.search(t) for t in terms):
+            fts_table, fts_query = "minutes_bigram", _bigram_query(query)
+        if fts_table:
+            # contentless FTS は snippet() を使えないので、ヒットした行だけ展開して切り出す
+            sql = f"""SELECT m.id, m.title, m.created_at, m.minutes_md, m.transcript
+                      FROM {fts_table} AS f JOIN minutes AS m ON m.id = f.rowid
+                      WHERE {fts_table} MATCH ?
+                      ORDER BY f.rank LIMIT ?"""
+            with self._lock:
+                rows = self.conn.execute(sql, (fts_query, limit)).fetchall()
+        else:
+            where = " AND ".join(
+                "(title LIKE ? OR unz(transcript) LIKE ? OR unz(minutes_md) LIKE ?)" for _ in terms)
+            params = [f"%{t}%" for t in terms for _ in range(3)]
+            sql = (f"SELECT id, title, created_at, minutes_md, transcript FROM minutes WHERE {where} "
+                   "ORDER BY created_at DESC, id DESC LIMIT ?")
+            with self._lock:
+                rows = self.conn.execute(sql, params + [limit]).fetchall()
+        results = []
+        for r in rows:
+            minutes_md = _decompress(r[3]) or ""
+            text = minutes_md if terms[0] in minutes_md else (_decompress(r[4]) or "")
+            results.append(dict(id=r[0], title=r[1], created_at=_parse_ts(r[2]),
+                                snippet=_make_snippet(text, terms[0])))
+        return results
@@ -0,0 +1,287 @@
+"""jobs.py – 議事録作成ジョブの永続キューとワーカープール
+
+ジョブとチャンクごとの文字起こし結果を minutes と同じ SQLite に保存する。
+Streamlit のリランやブラウザの再読み込みでは処理が止まらず、
+プロセスが落ちた場合も再起動時に未完了ジョブを再開し、
+文字起こし済みのチャンクは API を呼ばずに再利用する。
+"""
+from pathlib import Path
+import datetime as dt
+import json
+import logging
+import shutil
+import sqlite3
+import threading
+import traceback
+from dataclasses import replace
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+import metrics
+from cache import file_sha256
+from pipeline import Provider, merge_for, silence_chunk_count, split_for_providers, stream_pipelines
+
+ProviderFactory = Callable[[dict], List[Provider]]
+
+logger = logging.getLogger(__name__)
+
+UPLOADING, QUEUED, RUNNING, DONE, FAILED = "uploading", "queued", "running", "done", "failed"
+
+
+class JobQueue:
+    def __init__(self, db, provider_factory: ProviderFactory, *, workers: int = 2,
+                 jobs_dir: Optional[Path] = None, poll_sec: float = 5.0):
+        """
+        db               : MinutesDB（同じ SQLite ファイルにジョブ表を作り、結果の保存にも使う）
+        provider_factory : ジョブの params から Provider のリストを作る関数
+        workers          : 同時に処理するジョブ数
+        """
+        self.db = db
+        self.provider_factory = provider_factory
+        self.poll_sec = poll_sec
+        self.jobs_dir = Path(jobs_dir or Path(db.path).parent / "jobs")
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._wakeup = threading.Condition()
+        self._stopped = False
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db.path, check_same_thread=False, timeout=30)
+
+        with self._lock:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 title TEXT,
+                 source_path TEXT,
+                 params TEXT,
+                 status TEXT,
+                 total_chunks INTEGER,
+                 error TEXT,
+                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS job_chunks
+                (job_id INTEGER,
+                 provider TEXT,
+                 idx INTEGER,
+                 transcript TEXT,
+                 PRIMARY KEY (job_id, provider, idx))""")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS job_results
+                (job_id INTEGER,
+                 provider TEXT,
+                 transcript TEXT,
+                 minutes_md TEXT,
+                 agenda_md TEXT,
+                 error TEXT,
+                 PRIMARY KEY (job_id, provider))""")
+            # 前回のプロセスで実行中だったジョブは再開対象に戻す
+            self.conn.execute("UPDATE jobs SET status=? WHERE status=?", (QUEUED, RUNNING))
+            self.conn.execute("UPDATE jobs SET status=?, error=? WHERE status=?",
+                              (FAILED, "音声の保存中に中断されました", UPLOADING))
+            self.conn.commit()
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    # ─────────────────────────────────────────
+    # 投入・参照
+    # ─────────────────────────────────────────
+    def submit(self, source: BinaryIO, filename: str, params: Optional[dict] = None) -> int:
+        """音声をジョブ用ディレクトリへ保存してキューに積み、ジョブ ID を返す"""
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO jobs (title, params, status) VALUES (?,?,?)",
+                (filename, json.dumps(params or {}, ensure_ascii=False), UPLOADING))
+            job_id = cur.lastrowid
+            self.conn.commit()
+        job_dir = self.jobs_dir / str(job_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        source_path = job_dir / f"source{Path(filename).suffix.lower()}"
+        with open(source_path, "wb") as f:
+            shutil.copyfileobj(source, f, 1 << 20)
+        self._update(job_id, source_path=str(source_path), status=QUEUED)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        """新しい順にジョブの状態と進捗を返す"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, title, status, total_chunks, error, created_at, updated_at, params, source_path "
+                "FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            counts = dict(self.conn.execute(
+                "SELECT job_id, COUNT(*) FROM job_chunks WHERE job_id >= ? GROUP BY job_id",
+                (rows[-1][0] if rows else 0,)).fetchall())
+        return [dict(id=r[0], title=r[1], status=r[2], total_chunks=r[3], error=r[4],
+                     created_at=r[5], updated_at=r[6], params=json.loads(r[7] or "{}"),
+                     chunks_done=counts.get(r[0], 0), retryable=r[8] is not None)
+                for r in rows]
+
+    def fetch_results(self, job_id: int) -> List[Dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT provider, transcript, minutes_md, agenda_md, error FROM job_results "
+                "WHERE job_id=? ORDER BY provider", (job_id,)).fetchall()
+        return [dict(provider=r[0], transcript=r[1], minutes_md=r[2], agenda_md=r[3], error=r[4])
+                for r in rows]
+
+    def has_active_jobs(self) -> bool:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT 1 FROM jobs WHERE status IN (?, ?) LIMIT 1", (QUEUED, RUNNING)).fetchone() is not None
+
+    def retry(self, job_id: int):
+        """失敗したジョブを再投入する（文字起こし済みのチャンクはそのまま再利用される）"""
+        with self._lock:
+            row = self.conn.execute("SELECT source_path FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None or row[0] is None:
+            raise ValueError(f"ジョブ #{job_id} は音声が保存されていないため再実行できません")
+        self._update(job_id, status=QUEUED, error=None)
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def stop(self):
+        self._stopped = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    # ─────────────────────────────────────────
+    # 内部処理
+    # ─────────────────────────────────────────
+    def _update(self, job_id: int, **fields):
+        cols = ", ".join(f"{k}=?" for k in fields)
+        with self._lock:
+            self.conn.execute(
+                f"UPDATE jobs SET {cols}, updated_at=CURRENT_TIMESTAMP WHERE id=?",
+                (*fields.values(), job_id))
+            self.conn.commit()
+
+    def _claim_next(self) -> Optional[tuple]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, source_path, params FROM jobs WHERE status=? ORDER BY id LIMIT 1",
+                (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status=?, updated_at=CURRENT_TIMESTAMP WHERE id=?", (RUNNING, row[0]))
+            self.conn.commit()
+        return row
+
+    def _worker(self):
+        while not self._stopped:
+            try:
+                job = self._claim_next()
+            except sqlite3.Error:
+                logger.exception("ジョブの取得に失敗しました")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_sec)
+                continue
+            job_id = job[0]
+            try:
+                if job[1] is None:
+                    raise RuntimeError("音声が保存されていないため実行できません")
+                source_path, params = Path(job[1]), json.loads(job[2] or "{}")
+                with metrics.start_run(f"job #{job_id}"):
+                    self._run(job_id, source_path, params)
+                self._update(job_id, status=DONE, error=None)
+                shutil.rmtree(source_path.parent, ignore_errors=True)
+            except Exception:  # noqa: BLE001 – ジョブの失敗はワーカーを止めずに記録する
+                try:
+                    self._update(job_id, status=FAILED, error=traceback.format_exc(limit=5))
+                except sqlite3.Error:
+                    logger.exception("ジョブ #%d の失敗を記録できませんでした", job_id)
+
+    def _completed_chunks(self, job_id: int) -> Dict[str, Dict[int, str]]:
+        done: Dict[str, Dict[int, str]] = {}
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT provider, idx, transcript FROM job_chunks WHERE job_id=?", (job_id,)).fetchall()
+        for provider, idx, text in rows:
+            done.setdefault(provider, {})[idx] = text
+        return done
+
+    def _save_chunk(self, job_id: int, provider: str, idx: int, text: str):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO job_chunks (job_id, provider, idx, transcript) VALUES (?,?,?,?)",
+                (job_id, provider, idx, text))
+            self.conn.commit()
+
+    def _run(self, job_id: int, source_path: Path, params: dict):
+        # 再開時は、結果を保存済みのプロバイダを飛ばす（議事録の二重保存を防ぐ）
+        with self._lock:
+            finished_providers = {r[0] for r in self.conn.execute(
+                "SELECT provider FROM job_results WHERE job_id=? AND error IS NULL", (job_id,))}
+        providers = [p for p in self.provider_factory(params) if p.name not in finished_providers]
+        if not providers:
+            return
+        done = self._completed_chunks(job_id)
+        index_of: Dict[Path, int] = {}
+        if params.get("split_mode") == "silence" and "n_chunks" not in params:
+            # 再開時に残りのプロバイダから数え直すと切れ目が変わり、保存済みチャンクの番号とずれるので、
+            # 初回に決めた分割数をジョブに保存しておく
+            params["n_chunks"] = silence_chunk_count(providers)
+            self._update(job_id, params=json.dumps(params, ensure_ascii=False))
+
+        def _chunks():
+            paths = split_for_providers(
+                source_path, providers,
+                split_mode=params.get("split_mode", "fixed"),
+                profile=params.get("profile", "asr_mp3"),
+                chunk_length_sec=params.get("chunk_length_sec"),
+                overlap_sec=params.get("overlap_sec", 0.0),
+                n_chunks=params.get("n_chunks"),
+            )
+            n = 0
+            for n, path in enumerate(paths, start=1):
+                index_of[path] = n - 1
+                yield path
+            self._update(job_id, total_chunks=n)
+
+        def _checkpointed(provider: Provider) -> Provider:
+            finished = done.get(provider.name, {})
+            transcribe = provider.transcribe
+
+            def _transcribe(path: Path) -> str:
+                idx = index_of[path]
+                if idx in finished:
+                    return finished[idx]
+                text = transcribe(path)
+                self._save_chunk(job_id, provider.name, idx, text)
+                return text
+
+            def _prepare(path: Path):
+                # 文字起こし済みのチャンクはアップロードもしない
+                if provider.prepare and index_of[path] not in finished:
+                    provider.prepare(path)
+            return replace(provider, transcribe=_transcribe, prepare=_prepare)
+
+        providers = [_checkpointed(p) for p in providers]
+
+        merge = merge_for(params.get("overlap_sec", 0.0))
+        source_sha256 = file_sha256(source_path)
+        failed = []
+        for event in stream_pipelines(_chunks(), providers, merge=merge):
+            if event.kind != "done":
+                continue
+            result = event.result
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO job_results "
+                    "(job_id, provider, transcript, minutes_md, agenda_md, error) VALUES (?,?,?,?,?,?)",
+                    (job_id, result.name, result.transcript, result.minutes, result.agenda,
+                     repr(result.error) if result.error else None))
+                self.conn.commit()
+            if result.error:
+                failed.append(f"{result.name}: {result.error!r}")
+                continue
+            self.db.save_minutes(
+                f"{result.name} {dt.datetime.now():%Y-%m-%d %H:%M}", result.transcript, result.minutes,
+                provider=result.name, source_sha256=source_sha256)
+        if failed:
+            raise RuntimeError("一部のプロバイダで失敗しました: " + " / ".join(failed))
@@ -0,0 +1,234 @@
+"""metrics.py – 処理段階ごとの時間・バイト数・トークン数・概算料金の計測
+
+    with metrics.start_run("会議.m4a") as run:      # 1 回の処理（画面での実行・ジョブ）
+        with metrics.span("transcribe", provider="openai", model=...) as s:
+            ...
+            s.add_usage(tokens_in, tokens_out)
+    run.summary()                                   # 段階 × プロバイダごとの集計
+
+実行中の Run は contextvars で受け渡すため、スレッドプールへ投げる関数は bind() で包む。
+計測結果は data/metrics.sqlite3（環境変数 METRICS_DB_PATH で変更可）に保存し、
+stage_percentiles() で p50 / p95 の推移を見られる。
+"""
+from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_PATH = Path(__file__).parent / "data" / "metrics.sqlite3"
+
+# 100 万トークンあたりの料金（USD, 入力, 出力）。料金改定があるので目安として使う
+PRICES_PER_MTOK = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o-mini-transcribe": (1.25, 5.00),
+    "gemini-2.5-flash-preview-05-20": (0.15, 0.60),
+}
+# 音声入力の単価が別のモデル
+AUDIO_PRICES_PER_MTOK = {
+    "gpt-4o-mini-transcribe": 3.00,
+    "gemini-2.5-flash-preview-05-20": 1.00,
+}
+
+
+def estimate_cost(model: str, tokens_in: int, tokens_out: int, *, audio: bool = False) -> float:
+    price_in, price_out = PRICES_PER_MTOK.get(model, (0.0, 0.0))
+    if audio:
+        price_in = AUDIO_PRICES_PER_MTOK.get(model, price_in)
+    return (tokens_in * price_in + tokens_out * price_out) / 1_000_000
+
+
+@dataclass
+class Span:
+    stage: str
+    provider: str = ""
+    model: str = ""
+    audio: bool = False
+    started_at: float = 0.0
+    elapsed: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    error: Optional[str] = None
+
+    def add_usage(self, tokens_in: Optional[int], tokens_out: Optional[int]):
+        self.tokens_in += tokens_in or 0
+        self.tokens_out += tokens_out or 0
+
+    @property
+    def cost(self) -> float:
+        return estimate_cost(self.model, self.tokens_in, self.tokens_out, audio=self.audio)
+
+
+@dataclass
+class Run:
+    label: str = ""
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started_at: float = field(default_factory=time.time)
+    spans: List[Span] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> List[Dict]:
+        """段階 × プロバイダごとの回数・合計/最大時間・バイト数・トークン数・概算料金"""
+        rows: Dict[tuple, Dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            r = rows.setdefault((s.stage, s.provider), dict(
+                stage=s.stage, provider=s.provider, calls=0, errors=0, total_sec=0.0, max_sec=0.0,
+                bytes_in=0, bytes_out=0, tokens_in=0, tokens_out=0, cost_usd=0.0))
+            r["calls"] += 1
+            r["errors"] += s.error is not None
+            r["total_sec"] += s.elapsed
+            r["max_sec"] = max(r["max_sec"], s.elapsed)
+            for k in ("bytes_in", "bytes_out", "tokens_in", "tokens_out"):
+                r[k] += getattr(s, k)
+            r["cost_usd"] += s.cost
+        return sorted(rows.values(), key=lambda r: (r["provider"], r["stage"]))
+
+
+_current_run: contextvars.ContextVar[Optional[Run]] = contextvars.ContextVar("metrics_run", default=None)
+
+
+def current_run() -> Optional[Run]:
+    return _current_run.get()
+
+
+@contextmanager
+def start_run(label: str = "") -> Iterator[Run]:
+    run = Run(label=label)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        for r in run.summary():
+            logger.info("run %s [%s] %s/%s calls=%d total=%.2fs max=%.2fs tokens=%d/%d cost=$%.4f",
+                        run.run_id[:8], label, r["provider"] or "-", r["stage"], r["calls"], r["total_sec"],
+                        r["max_sec"], r["tokens_in"], r["tokens_out"], r["cost_usd"])
+
+
+@contextmanager
+def span(stage: str, *, provider: str = "", model: str = "", audio: bool = False,
+         bytes_in: int = 0) -> Iterator[Span]:
+    """with ブロックの所要時間を計測し、実行中の Run と SQLite に記録する"""
+    s = Span(stage=stage, provider=provider, model=model, audio=audio, started_at=time.time(), bytes_in=bytes_in)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.elapsed = time.perf_counter() - t0
+        run = current_run()
+        if run is not None:
+            run.add(s)
+        try:
+            get_store().record(s, run)
+        except sqlite3.Error:
+            logger.exception("メトリクスの保存に失敗しました")
+
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """呼び出し元の contextvars（実行中の Run）を引き継いで fn を実行する関数を返す
+       （スレッドプールのワーカーは呼び出し元のコンテキストを持たないため）
+    """
+    ctx = contextvars.copy_context()
+
+    def _run(*args, **kwargs):
+        # 同じ Context には複数スレッドから同時に入れないので、呼び出しごとに複製する
+        return ctx.copy().run(fn, *args, **kwargs)
+    return _run
+
+
+# ─────────────────────────────────────────
+# SQLite への保存と p50 / p95 の集計
+# ─────────────────────────────────────────
+class MetricsStore:
+    def __init__(self, db_path: Path = DEFAULT_METRICS_PATH):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS spans
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+             run_id TEXT,
+             run_label TEXT,
+             stage TEXT,
+             provider TEXT,
+             model TEXT,
+             started_at REAL,
+             elapsed REAL,
+             bytes_in INTEGER,
+             bytes_out INTEGER,
+             tokens_in INTEGER,
+             tokens_out INTEGER,
+             cost_usd REAL,
+             error TEXT)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_stage ON spans(stage, provider, started_at)")
+        self.conn.commit()
+
+    def record(self, s: Span, run: Optional[Run] = None):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO spans (run_id, run_label, stage, provider, model, started_at, elapsed, "
+                "bytes_in, bytes_out, tokens_in, tokens_out, cost_usd, error) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                (run.run_id if run else None, run.label if run else None, s.stage, s.provider, s.model,
+                 s.started_at, s.elapsed, s.bytes_in, s.bytes_out, s.tokens_in, s.tokens_out, s.cost, s.error))
+            self.conn.commit()
+
+    def stage_percentiles(self, *, days: float = 30) -> List[Dict]:
+        """直近 days 日の段階 × プロバイダごとの件数・p50・p95（秒）・トークン数・料金"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT stage, provider, elapsed, tokens_in + tokens_out, cost_usd FROM spans "
+                "WHERE started_at >= ? AND error IS NULL ORDER BY stage, provider, elapsed",
+                (time.time() - days * 86400,)).fetchall()
+        groups: Dict[tuple, List[tuple]] = {}
+        for stage, provider, elapsed, tokens, cost in rows:
+            groups.setdefault((stage, provider), []).append((elapsed, tokens, cost))
+        result = []
+        for (stage, provider), values in groups.items():
+            elapsed = [v[0] for v in values]  # elapsed 昇順
+            result.append(dict(
+                stage=stage, provider=provider, calls=len(values),
+                p50_sec=_percentile(elapsed, 0.50), p95_sec=_percentile(elapsed, 0.95),
+                tokens=sum(v[1] for v in values), cost_usd=sum(v[2] for v in values)))
+        return sorted(result, key=lambda r: (r["provider"], r["stage"]))
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+_store: Optional[MetricsStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> MetricsStore:
+    """プロセス内で共有する MetricsStore を返す（初回呼び出し時に生成）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetricsStore(Path(os.getenv("METRICS_DB_PATH") or DEFAULT_METRICS_PATH))
+        return _store
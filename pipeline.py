@@ -0,0 +1,288 @@
+"""pipeline.py – チャンク単位の文字起こし〜議事録・アジェンダ生成をプロバイダごとに並列実行する
+"""
+from pathlib import Path
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Union
+
+from audio_utils import DEFAULT_PROFILE, split_on_silence, stream_audio_chunks
+from metrics import bind
+from transcript_utils import merge_transcripts
+
+TranscribeFn = Callable[[Path], str]
+GenerateFn = Callable[[str], str]
+PrepareFn = Callable[[Path], None]
+
+
+# ─────────────────────────────────────────
+# チャンクファイルの参照カウント
+#   全プロバイダが処理し終えたチャンクだけを削除する
+# ─────────────────────────────────────────
+class ChunkTracker:
+    def __init__(self, delete: bool = True):
+        self.delete = delete
+        self._lock = threading.Lock()
+        self._pending: Dict[Path, int] = {}
+
+    def register(self, path: Path, users: int):
+        with self._lock:
+            self._pending[path] = self._pending.get(path, 0) + users
+
+    def release(self, path: Path):
+        with self._lock:
+            left = self._pending.get(path, 0) - 1
+            if left > 0:
+                self._pending[path] = left
+                return
+            self._pending.pop(path, None)
+        if self.delete:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+def _submit_chunks(
+    chunk_paths: Iterable[Path],
+    transcribers: Mapping[str, TranscribeFn],
+    executors: Mapping[str, ThreadPoolExecutor],
+    tracker: ChunkTracker,
+    prepare: Optional[Mapping[str, PrepareFn]] = None,
+) -> Dict[str, List[Future]]:
+    """各チャンクを全プロバイダの executor へ投入し、チャンク順の Future を返す
+       （prepare があれば投入前に呼び、アップロードなどを先行して始めさせる）
+    """
+    futures: Dict[str, List[Future]] = {name: [] for name in transcribers}
+    for chunk in chunk_paths:
+        tracker.register(chunk, len(transcribers))
+        for name, fn in transcribers.items():
+            if prepare and prepare.get(name):
+                prepare[name](chunk)
+            fut = executors[name].submit(bind(fn), chunk)
+            fut.add_done_callback(lambda _f, p=chunk: tracker.release(p))
+            futures[name].append(fut)
+    return futures
+
+
+def _make_executor(name: str, workers: int) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"transcribe-{name}")
+
+
+# ─────────────────────────────────────────
+# 全チャンク × 全プロバイダを並列で文字起こし
+# ─────────────────────────────────────────
+def transcribe_chunks(
+    chunk_paths: Iterable[Path],
+    providers: Mapping[str, TranscribeFn],
+    *,
+    max_workers: Union[int, Mapping[str, int]] = 4,
+    delete_chunks: bool = True,
+) -> Dict[str, List[str]]:
+    """各チャンクを全プロバイダへ同時に投げ、プロバイダごとにチャンク順の文字起こしを返す。
+       - max_workers はプロバイダごとの同時実行数（int なら全プロバイダ共通）
+       - チャンクファイルは全プロバイダの処理が終わった時点で削除する
+    """
+    tracker = ChunkTracker(delete=delete_chunks)
+    executors = {
+        name: _make_executor(name, max_workers if isinstance(max_workers, int) else max_workers.get(name, 4))
+        for name in providers
+    }
+    try:
+        futures = _submit_chunks(chunk_paths, providers, executors, tracker)
+        # チャンク順に結果を並べ直す（例外はそのまま送出）
+        return {
+            name: [f.result().strip() for f in futs]
+            for name, futs in futures.items()
+        }
+    finally:
+        for ex in executors.values():
+            ex.shutdown(wait=True, cancel_futures=True)
+
+
+# ─────────────────────────────────────────
+# プロバイダごとの 文字起こし → 議事録・アジェンダ パイプライン
+# ─────────────────────────────────────────
+StreamFn = Callable[[str], Iterator[str]]
+
+
+@dataclass
+class Provider:
+    name: str
+    transcribe: TranscribeFn
+    generate_minutes: GenerateFn       # transcript -> 議事録 Markdown
+    generate_next_agenda: GenerateFn   # transcript -> 次回アジェンダ Markdown
+    max_concurrency: int = 4
+    # 指定があれば生成をストリーミングで行い、途中経過を token イベントとして流す
+    stream_minutes: Optional[StreamFn] = None
+    stream_next_agenda: Optional[StreamFn] = None
+    # チャンクが届いた時点で呼ばれる（ブロックしないこと）。文字起こしの順番待ちの間にアップロードを進める
+    prepare: Optional[PrepareFn] = None
+
+
+@dataclass
+class ProviderResult:
+    name: str
+    transcript: str = ""
+    minutes: str = ""
+    agenda: str = ""
+    elapsed: float = 0.0
+    error: Optional[BaseException] = None
+
+
+@dataclass
+class PipelineEvent:
+    name: str                 # プロバイダ名
+    kind: str                 # "transcript" | "token" | "done"
+    field: str = ""           # token のとき "minutes" / "agenda"
+    text: str = ""            # transcript 全文、または token の差分
+    result: Optional[ProviderResult] = None   # done のときの最終結果
+
+
+def stream_pipelines(
+    chunk_paths: Iterable[Path],
+    providers: List[Provider],
+    *,
+    merge: Callable[[List[str]], str] = "".join,
+    delete_chunks: bool = True,
+) -> Iterator[PipelineEvent]:
+    """プロバイダごとのチェーンを並列実行し、進捗をイベントとして yield する。
+       - 文字起こしはチャンク × プロバイダで並列
+       - チャンク順の文字起こしを merge で 1 つにまとめる（重ねて分割した場合は merge_transcripts）
+       - 文字起こし完了後、議事録とアジェンダを並列に生成（stream_* があれば token イベントを流す）
+       - 1 プロバイダの失敗は ProviderResult.error に入れ、他のプロバイダは続行
+       イベントはワーカースレッドからキューへ積まれ、呼び出し元スレッドで順に取り出される
+       （Streamlit の描画を呼び出し元スレッドだけで行うため）。
+       ワーカーには呼び出し元の contextvars を引き継ぐ（metrics の計測を同じ Run に集めるため）。
+    """
+    started = time.perf_counter()
+    events: "queue.Queue[PipelineEvent]" = queue.Queue()
+    tracker = ChunkTracker(delete=delete_chunks)
+    executors = {p.name: _make_executor(p.name, p.max_concurrency) for p in providers}
+    generation = ThreadPoolExecutor(max_workers=2 * len(providers), thread_name_prefix="generate")
+    chains = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="chain")
+
+    def _generate(provider: Provider, field: str, transcript: str) -> str:
+        fn = provider.generate_minutes if field == "minutes" else provider.generate_next_agenda
+        stream = provider.stream_minutes if field == "minutes" else provider.stream_next_agenda
+        if stream is None:
+            return fn(transcript)
+        pieces = []
+        for piece in stream(transcript):
+            pieces.append(piece)
+            events.put(PipelineEvent(provider.name, "token", field, piece))
+        return "".join(pieces).strip()
+
+    def _chain(provider: Provider, futs: List[Future]):
+        result = ProviderResult(name=provider.name)
+        try:
+            result.transcript = merge([f.result().strip() for f in futs])
+            events.put(PipelineEvent(provider.name, "transcript", text=result.transcript))
+            minutes = generation.submit(bind(_generate), provider, "minutes", result.transcript)
+            agenda = generation.submit(bind(_generate), provider, "agenda", result.transcript)
+            result.minutes = minutes.result()
+            result.agenda = agenda.result()
+        except Exception as e:  # noqa: BLE001 – 他プロバイダを止めないため握って返す
+            result.error = e
+        result.elapsed = time.perf_counter() - started
+        events.put(PipelineEvent(provider.name, "done", result=result))
+
+    try:
+        futures = _submit_chunks(
+            chunk_paths, {p.name: p.transcribe for p in providers}, executors, tracker,
+            prepare={p.name: p.prepare for p in providers},
+        )
+        for p in providers:
+            chains.submit(bind(_chain), p, futures[p.name])
+        remaining = len(providers)
+        while remaining:
+            event = events.get()
+            if event.kind == "done":
+                remaining -= 1
+            yield event
+    finally:
+        for ex in (*executors.values(), generation, chains):
+            ex.shutdown(wait=True, cancel_futures=True)
+
+
+def run_pipelines(
+    chunk_paths: Iterable[Path],
+    providers: List[Provider],
+    *,
+    merge: Callable[[List[str]], str] = "".join,
+    delete_chunks: bool = True,
+) -> Iterator[ProviderResult]:
+    """stream_pipelines の完了イベントだけを取り出し、終わったプロバイダから順に結果を yield する"""
+    for event in stream_pipelines(chunk_paths, providers, merge=merge, delete_chunks=delete_chunks):
+        if event.kind == "done":
+            yield event.result
+
+
+# ─────────────────────────────────────────
+# チャンク分割と文字起こしの結合方法
+#   画面・バックグラウンドジョブ・cli.py で同じ分割をするための共通処理
+# ─────────────────────────────────────────
+def silence_chunk_count(providers: List[Provider]) -> int:
+    """無音分割の分割数（最も同時実行数の少ないプロバイダに合わせる）"""
+    return min(p.max_concurrency for p in providers)
+
+
+def split_for_providers(
+    source: Union[Path, BinaryIO],
+    providers: List[Provider],
+    *,
+    split_mode: str = "fixed",
+    profile: str = DEFAULT_PROFILE,
+    chunk_length_sec: Optional[int] = None,
+    overlap_sec: float = 0.0,
+    n_chunks: Optional[int] = None,
+    original_filename: str = "",
+    hasher=None,
+) -> Iterable[Path]:
+    """split_mode に応じて音声をチャンクへ分割する。
+       - "silence": 無音区間で n_chunks 個（省略時は silence_chunk_count）に分け、各チャンクは chunk_length_sec 以下
+                    （全体を読む必要があるため、ファイルオブジェクトは一時ファイルへ書き出してから分割する）
+       - それ以外 : chunk_length_sec ごとに分割し、できたチャンクから順に yield する
+                    （ファイルオブジェクトは ffmpeg の stdin へそのまま流す）
+       hasher を渡すと、ファイルオブジェクトから読んだ元音声のバイト列で update する。
+    """
+    if split_mode != "silence":
+        return stream_audio_chunks(source, original_filename=original_filename, profile=profile,
+                                   chunk_length_sec=chunk_length_sec, hasher=hasher)
+    spooled = None
+    if not isinstance(source, (str, Path)):
+        suffix = Path(original_filename or getattr(source, "name", "")).suffix
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tf:
+            if hasher is None:
+                shutil.copyfileobj(source, tf, 1 << 20)
+            else:
+                for block in iter(lambda: source.read(1 << 20), b""):
+                    hasher.update(block)
+                    tf.write(block)
+        source = spooled = Path(tf.name)
+    try:
+        return split_on_silence(
+            source,
+            n_chunks=n_chunks or silence_chunk_count(providers),
+            max_sec=chunk_length_sec,
+            overlap_sec=overlap_sec,
+            profile=profile,
+        )
+    finally:
+        if spooled is not None:
+            os.remove(spooled)
+
+
+def merge_for(overlap_sec: float) -> Callable[[List[str]], str]:
+    """チャンクを重ねて分割したときは重なりを取り除いて結合する"""
+    return merge_transcripts if overlap_sec > 0 else "".join
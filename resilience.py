@@ -0,0 +1,264 @@
+"""resilience.py – API 呼び出しの共通リトライ・レート制御層
+
+プロバイダ/モデルごとに 1 つの Guard を共有し、
+- トークンバケットで requests/min と tokens/min を超えないよう待機
+- 429・5xx・タイムアウト・接続エラーは指数バックオフ（フルジッター）で再試行
+  （Retry-After があれば優先し、同じモデルの他スレッドも一緒に待たせる）
+- 5xx・接続エラーが続いたらサーキットブレーカーを開き、一定時間は即座に失敗させる
+ストリーミング呼び出しは最初のトークンを受け取る前の失敗だけを再試行する。
+"""
+from dataclasses import dataclass
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitOpenError(RuntimeError):
+    """サーキットブレーカーが開いている間の呼び出し"""
+
+
+# ─────────────────────────────────────────
+# トークンバケット
+#   クォータは 1 分単位なので、容量は既定で 1 分ぶん（同時に出る大きな要求を不要に待たせない）
+#   容量を超える要求（長い文字起こしなど）は満杯になるまで待ってから借り越す
+# ─────────────────────────────────────────
+class TokenBucket:
+    def __init__(self, per_minute: float, *, burst_sec: float = 60.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_sec)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        if now > self._paused_until:
+            start = max(self._updated, self._paused_until)
+            self._level = min(self.capacity, self._level + (now - start) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0):
+        need = min(amount, self.capacity)
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._level >= need:
+                    self._level -= amount
+                    return
+                wait = max(self._paused_until - now, (need - self._level) / self.rate)
+                self._cond.wait(max(wait, 0.001))
+
+    def pause(self, seconds: float):
+        """Retry-After を受けたとき、以降の取得を seconds 秒止める"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._level = min(self._level, 0.0)
+
+
+# ─────────────────────────────────────────
+# サーキットブレーカー
+# ─────────────────────────────────────────
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_sec: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_sec = reset_sec
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "open" if time.monotonic() - self._opened_at < self.reset_sec else "half_open"
+
+    def allow(self) -> bool:
+        # half_open では呼び出しを通し、その結果で閉じるか開き直すかを決める
+        return self.state != "open"
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+# ─────────────────────────────────────────
+# 例外の分類
+#   SDK ごとの例外型に依存しないよう、ステータスコード属性と原因の連鎖を見る
+# ─────────────────────────────────────────
+def status_of(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _is_transport_error(exc: BaseException) -> bool:
+    try:
+        import httpx
+        transport = (httpx.TransportError,)
+    except ImportError:
+        transport = ()
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (TimeoutError, ConnectionError) + transport):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def classify(exc: BaseException) -> Optional[str]:
+    """再試行できる例外なら "rate_limit" / "server" / "transport" を、できなければ None を返す"""
+    status = status_of(exc)
+    if status == 429:
+        return "rate_limit"
+    if status is not None and (status in RETRYABLE_STATUS or status >= 500):
+        return "server"
+    if status is None and _is_transport_error(exc):
+        return "transport"
+    return None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+# ─────────────────────────────────────────
+# Guard: レート制御 + リトライ + ブレーカー
+# ─────────────────────────────────────────
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 6
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    max_elapsed: float = 600.0  # これを超えたら再試行しない
+
+    def backoff(self, attempt: int) -> float:
+        """attempt 回目（1 始まり）の失敗後の待ち時間（フルジッター）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class Guard:
+    def __init__(self, name: str, *, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 policy: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = 0
+        self.throttled = 0
+
+    def _acquire(self, tokens: int):
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens and tokens:
+            self.tokens.acquire(tokens)
+
+    def _before_attempt(self, tokens: int):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name}: 連続して失敗したため一時的に呼び出しを止めています")
+        self._acquire(tokens)
+
+    def _on_failure(self, exc: BaseException, attempt: int, started: float) -> float:
+        """再試行するなら待ち時間を返し、しないなら例外をそのまま投げ直す"""
+        kind = classify(exc)
+        if kind is None:
+            raise exc
+        if kind == "rate_limit":
+            self.throttled += 1
+        else:
+            self.breaker.record_failure()
+        delay = retry_after(exc)
+        if delay is not None and kind == "rate_limit":
+            for bucket in (self.requests, self.tokens):
+                if bucket:
+                    bucket.pause(delay)
+        delay = delay if delay is not None else self.policy.backoff(attempt)
+        if attempt >= self.policy.max_attempts or time.monotonic() - started + delay > self.policy.max_elapsed:
+            raise exc
+        self.retries += 1
+        return delay
+
+    def call(self, fn: Callable[[], T], *, tokens: int = 0) -> T:
+        started = time.monotonic()
+        for attempt in range(1, self.policy.max_attempts + 1):
+            self._before_attempt(tokens)
+            try:
+                result = fn()
+            except Exception as exc:  # noqa: BLE001 – 分類して再試行するか決める
+                time.sleep(self._on_failure(exc, attempt, started))
+                continue
+            self.breaker.record_success()
+            return result
+        raise AssertionError("unreachable")
+
+    def stream(self, open_stream: Callable[[], Iterator[T]], *, tokens: int = 0) -> Iterator[T]:
+        """最初の要素を受け取るまでは call と同様に再試行し、その後の失敗はそのまま伝える"""
+        started = time.monotonic()
+        for attempt in range(1, self.policy.max_attempts + 1):
+            self._before_attempt(tokens)
+            it = None
+            try:
+                it = iter(open_stream())
+                first = next(it)
+            except StopIteration:
+                self.breaker.record_success()
+                return
+            except Exception as exc:  # noqa: BLE001
+                if it is not None and hasattr(it, "close"):
+                    it.close()
+                time.sleep(self._on_failure(exc, attempt, started))
+                continue
+            self.breaker.record_success()
+            yield first
+            yield from it
+            return
+        raise AssertionError("unreachable")
+
+
+_guards: Dict[Tuple[str, str], Guard] = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(provider: str, model: str, *, rpm: Optional[float] = None, tpm: Optional[float] = None) -> Guard:
+    """(provider, model) ごとにプロセス内で共有する Guard（初回呼び出し時の rpm/tpm で作成）"""
+    with _guards_lock:
+        guard = _guards.get((provider, model))
+        if guard is None:
+            guard = _guards[(provider, model)] = Guard(f"{provider}/{model}", rpm=rpm, tpm=tpm)
+        return guard
+
+
+def configure(provider: str, model: str, *, rpm: Optional[float] = None, tpm: Optional[float] = None,
+              policy: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None) -> Guard:
+    """Guard を設定し直す（クォータの異なるアカウントやベンチマーク用）"""
+    with _guards_lock:
+        guard = _guards[(provider, model)] = Guard(f"{provider}/{model}", rpm=rpm, tpm=tpm,
+                                                   policy=policy, breaker=breaker)
+        return guard
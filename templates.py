@@ -46,3 +46,30 @@ AGENDA_PROMPT = """
 ---
 
 """
+
+
+# ─────────────────────────────────────────
+# プロバイダ共通の指示文（core_openai / core_gemini で同じ文面を使う）
+# ─────────────────────────────────────────
+MINUTES_INSTRUCTION = (
+    "あなたは日本語の議事録作成アシスタントです。"
+    "以下のテンプレートに従って、文字起こしデータを要約して議事録としてまとめてください。"
+)
+
+AGENDA_INSTRUCTION = (
+    "あなたはプロのファシリテーターです。"
+    "会議文字起こしと（あれば）過去の会議で未完了のタスク一覧をもとに、"
+    "## 次回アジェンダ と ## 宿題・タスク を Markdown 形式で作成してください。"
+    "- 宿題には担当者・期日を含める"
+)
+
+# 過去の会議から持ち越している未完了タスク（{tasks} を埋めて使う）
+OPEN_TASKS_HEADER = "過去の会議で未完了のタスク一覧（［保存日 議題］）:\n{tasks}"
+
+# 長い文字起こしの部分要約（{index}/{total} を埋めて使う）
+MAP_INSTRUCTION = (
+    "あなたは日本語の議事録作成アシスタントです。"
+    "以下は長い会議の文字起こしの一部（{index}/{total}）です。"
+    "話し合われた議題ごとに、協議事項・決定事項（文頭に◆）・タスク（文末に（★担当者名　期限））を"
+    "漏れなく箇条書きで抜き出してください。日時・場所・参加者がわかれば併記してください。"
+)
@@ -0,0 +1,67 @@
+"""transcript_utils.py – チャンクごとの文字起こしを結合するユーティリティ
+"""
+from difflib import SequenceMatcher
+import re
+from typing import Iterable, List
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（かな・漢字は 1 文字 ≒ 1 トークン、英数字は 4 文字 ≒ 1 トークン）"""
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+
+def split_transcript(text: str, max_tokens: int) -> List[str]:
+    """
+    文字起こしを max_tokens 以下の部分に分ける（部分要約用）。
+    文末（。！？や改行）で区切り、1 文が長すぎる場合だけ文字数で切る。
+    """
+    parts: List[str] = []
+    current, current_tokens = [], 0
+    for sentence in re.split(r"(?<=[。！？!?\n])", text):
+        tokens = estimate_tokens(sentence)
+        if current and current_tokens + tokens > max_tokens:
+            parts.append("".join(current))
+            current, current_tokens = [], 0
+        while tokens > max_tokens:
+            cut = max(1, len(sentence) * max_tokens // tokens)
+            parts.append(sentence[:cut])
+            sentence = sentence[cut:]
+            tokens = estimate_tokens(sentence)
+        current.append(sentence)
+        current_tokens += tokens
+    if current and "".join(current).strip():
+        parts.append("".join(current))
+    return parts
+
+
+def merge_transcripts(
+    parts: Iterable[str],
+    *,
+    window: int = 120,
+    min_match: int = 6,
+    sep: str = "",
+) -> str:
+    """
+    重ねて切り出したチャンクの文字起こしを、境界で重複した部分を取り除きながら結合する。
+    前のチャンクの末尾 window 文字と次のチャンクの先頭 window 文字で最長一致を探し、
+    min_match 文字以上一致すれば一致位置でつなぐ（一致しなければ sep で連結）。
+    """
+    merged = ""
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        if not merged:
+            merged = part
+            continue
+        tail = merged[-window:]
+        head = part[:window]
+        m = SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(
+            0, len(tail), 0, len(head))
+        # 重複は「前の末尾側」と「次の先頭側」にあるはずなので、それ以外の一致は偶然とみなす
+        if m.size >= min_match and m.a >= len(tail) // 2 and m.b <= len(head) // 2:
+            merged = merged[: len(merged) - len(tail) + m.a] + part[m.b:]
+        else:
+            merged = merged + sep + part
+    return merged